@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# run.py
+#
+# Copyright 2014 Carlos Cesar Caballero Diaz <ccesar@linuxmail.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+"""
+tinP benchmarks over a synthetic file: repository, everything runs offline
+
+    python benchmarks/run.py --packages 20000 --output after.json --compare before.json
+
+Every phase records its wall time, the peak RSS of the process during the
+phase and how far that peak went over the RSS the phase started with. On
+Linux the peak is reset before every phase through /proc/self/clear_refs,
+elsewhere only the peak of the whole process is known and the increase is
+not recorded. Results are written as json so runs can be compared.
+"""
+
+from __future__ import absolute_import, print_function
+
+__author__ = 'cccaballero'
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import generate_repository
+from cache import IndexCache
+from parsers import create_section
+from repository import SourceRepository, TinpRepository
+from planner import plan_upgrade
+try:
+    import resource
+except ImportError:
+    resource = None
+
+ARCH = 'binary-amd64'
+
+
+def peak_rss():
+    """
+    Return the peak resident set size of the process since it started in
+    KiB, None if unknown
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KiB elsewhere
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def memory_status():
+    """
+    Return the current and the peak resident set size of the process in KiB
+    read from /proc/self/status, (None, None) if unknown
+    """
+    try:
+        with open('/proc/self/status') as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line)
+        return int(fields['VmRSS'].split()[0]), int(fields['VmHWM'].split()[0])
+    except (IOError, OSError, KeyError, ValueError):
+        return None, None
+
+
+def reset_peak_rss():
+    """
+    Reset the peak resident set size of the process to the current one
+    :return: False if the system does not support it
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except (IOError, OSError):
+        return False
+    return True
+
+
+class Quiet(object):
+    """
+        Silence the progress output of a phase
+    """
+
+    def __enter__(self):
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+
+    def __exit__(self, *args):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+
+
+class Benchmark(object):
+
+    def __init__(self, work_dir, packages=1000, fanout=3, provides=0.05, deb_size=4096, roots=50, jobs=4,
+                 upgrade_fraction=0.1, seed=1):
+        """
+        Runs the benchmark phases over a synthetic repository
+        :param work_dir: directory for the source repository, the cache and the tinP repository
+        :param roots: number of packages requested with add
+        :param jobs: simultaneous downloads and loaded sections
+        :param upgrade_fraction: fraction of packages upgraded for the upgrade phase
+        """
+        self.work_dir = work_dir
+        self.parameters = {'packages': packages, 'fanout': fanout, 'provides': provides, 'deb_size': deb_size,
+                           'roots': roots, 'jobs': jobs, 'upgrade_fraction': upgrade_fraction, 'seed': seed}
+        self.results = []
+
+    def phase(self, name, function, *args):
+        reset = reset_peak_rss()
+        start_rss = memory_status()[0]
+        with Quiet():
+            start = time.time()
+            result = function(*args)
+            seconds = time.time() - start
+        peak = memory_status()[1]
+        if reset and start_rss is not None and peak is not None:
+            increase = peak - start_rss
+        else:
+            # the peak of the whole process, earlier phases included
+            peak = peak_rss()
+            increase = None
+        self.results.append({'phase': name, 'seconds': round(seconds, 6), 'peak_rss_kb': peak,
+                             'rss_increase_kb': increase})
+        print('%-20s %10.3fs %12s KiB %12s KiB' % (name, seconds, peak, increase))
+        return result
+
+    def source(self, cache):
+        sections = create_section(self.sources_line)
+        return SourceRepository(sections, arch=ARCH, cache=cache, workers=self.parameters['jobs'])
+
+    def remove(self, tinp, roots):
+        manifest = tinp.get_manifest()
+        for root in roots:
+            manifest.discard(root)
+            if root in tinp.packages:
+                tinp.remove_package(root)
+        tinp.collect_garbage()
+        tinp.rebuild_repo_index()
+
+    def run(self):
+        parameters = self.parameters
+        source_dir = os.path.join(self.work_dir, 'source')
+        cache = IndexCache(os.path.join(self.work_dir, 'cache'))
+        tinp_dir = os.path.join(self.work_dir, 'tinp')
+
+        self.sources_line = self.phase('generate', generate_repository, source_dir, parameters['packages'],
+                                       parameters['fanout'], parameters['provides'], parameters['deb_size'])
+        source = self.source(None)
+        self.phase('load', source.load_packages)
+        source = self.source(cache)
+        self.phase('load_cache_cold', source.load_packages)
+        source = self.source(cache)
+        self.phase('load_cache_warm', source.load_packages)
+
+        rng = random.Random(parameters['seed'])
+        roots = ['pkg%d' % index for index in rng.sample(range(parameters['packages']),
+                                                            min(parameters['roots'], parameters['packages']))]
+        self.phase('closure_single', lambda: [source.get_package_tree(root) for root in roots])
+        source.resolver = None
+        tree = self.phase('closure_batch', source.get_packages_tree, roots)
+
+        tinp = TinpRepository(tinp_dir, arch=ARCH)
+        self.phase('add', lambda: (tinp.add_packages(tree.values(), workers=parameters['jobs']),
+                                   tinp.add_roots(roots)))
+        self.phase('rebuild', tinp.rebuild_repo_index)
+        tinp = self.phase('load_tinp', TinpRepository, tinp_dir, {}, ARCH)
+        self.phase('rebuild_unchanged', tinp.rebuild_repo_index)
+
+        self.phase('generate_upgrade', generate_repository, source_dir, parameters['packages'],
+                   parameters['fanout'], parameters['provides'], parameters['deb_size'], 'bench', 'main', ARCH,
+                   2, parameters['upgrade_fraction'])
+        source = self.source(cache)
+        self.phase('load_upgrade', source.load_packages)
+        plan = self.phase('plan_upgrade', plan_upgrade, tinp, source)
+        self.phase('upgrade', lambda: (tinp.add_packages(plan.packages(), workers=parameters['jobs']),
+                                       tinp.rebuild_repo_index()))
+
+        self.phase('remove', self.remove, tinp, roots[:len(roots) // 2])
+        return self.report()
+
+    def report(self):
+        return {'parameters': self.parameters,
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'results': self.results}
+
+
+def compare(report, baseline):
+    """
+    Print the time and the RSS increase of every phase against a previous run
+    """
+    previous = dict((result['phase'], result) for result in baseline['results'])
+    print('%-20s %10s %10s %8s %14s %14s' % ('phase', 'before', 'after', 'ratio', 'RSS before', 'RSS after'))
+    for result in report['results']:
+        old = previous.get(result['phase'])
+        if old is None:
+            continue
+        ratio = result['seconds'] / old['seconds'] if old['seconds'] else float('inf')
+        # results written before the peak was reset per phase have no increase
+        print('%-20s %9.3fs %9.3fs %7.2fx %10s KiB %10s KiB' % (result['phase'], old['seconds'], result['seconds'],
+                                                               ratio, old.get('rss_increase_kb'),
+                                                               result.get('rss_increase_kb')))
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark tinP over a synthetic file: repository.')
+    parser.add_argument('--packages', type=int, default=1000, help='number of packages (default 1000)')
+    parser.add_argument('--fanout', type=float, default=3, help='mean Depends per package (default 3)')
+    parser.add_argument('--provides', type=float, default=0.05,
+                        help='fraction of packages providing a virtual package (default 0.05)')
+    parser.add_argument('--deb-size', type=int, default=4096, help='mean .deb size in bytes (default 4096)')
+    parser.add_argument('--roots', type=int, default=50, help='packages requested with add (default 50)')
+    parser.add_argument('--jobs', type=int, default=4, help='simultaneous downloads (default 4)')
+    parser.add_argument('--upgrade-fraction', type=float, default=0.1,
+                        help='fraction of packages upgraded (default 0.1)')
+    parser.add_argument('--seed', type=int, default=1, help='random seed (default 1)')
+    parser.add_argument('--work-dir', help='keep the generated repositories in this directory')
+    parser.add_argument('--output', help='write the results to this json file')
+    parser.add_argument('--compare', help='json results of a previous run to compare with')
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='tinp-bench-')
+    try:
+        benchmark = Benchmark(work_dir, args.packages, args.fanout, args.provides, args.deb_size, args.roots,
+                              args.jobs, args.upgrade_fraction, args.seed)
+        report = benchmark.run()
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
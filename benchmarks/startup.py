@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# startup.py
+#
+# Copyright 2014 Carlos Cesar Caballero Diaz <ccesar@linuxmail.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+"""
+tinP startup benchmark, every command runs in a new interpreter
+
+    python benchmarks/startup.py --runs 20 --output after.json --compare before.json
+
+The best and the median wall time of every command are recorded, the
+"python" command (an empty interpreter) is the floor nothing can go under.
+"""
+
+from __future__ import absolute_import, print_function
+
+__author__ = 'cccaballero'
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI = os.path.join(ROOT, 'tinp-cli.py')
+
+
+def commands(repo_path):
+    """
+    Return the benchmarked commands as (name, arguments) tuples
+    """
+    python = [sys.executable, '-W', 'ignore']
+    return [('python', python + ['-c', 'pass']),
+            ('import_parsers', python + ['-c', 'import parsers']),
+            ('import_repository', python + ['-c', 'import repository']),
+            ('cli_version', python + [CLI, '--version']),
+            ('cli_help', python + [CLI, '--help']),
+            # nothing listens on port 9, the client fails once it is ready to send
+            ('cli_client', python + [CLI, repo_path, '--server', 'http://127.0.0.1:9', '--gc']),
+            ('cli_gc', python + [CLI, repo_path, '--gc'])]
+
+
+def measure(arguments, runs):
+    """
+    Run a command several times
+    :return: (best, median) wall times in seconds
+    """
+    times = []
+    with open(os.devnull, 'w') as devnull:
+        for _ in range(runs):
+            start = time.time()
+            subprocess.call(arguments, cwd=ROOT, stdout=devnull, stderr=devnull)
+            times.append(time.time() - start)
+    times.sort()
+    return times[0], times[len(times) // 2]
+
+
+def run(runs):
+    repo_path = tempfile.mkdtemp(prefix='tinp-startup-')
+    # an existing (empty) index, as in any repository after its first add
+    index_dir = os.path.join(repo_path, 'dists', 'tinp', 'main', 'binary-amd64')
+    os.makedirs(index_dir)
+    open(os.path.join(index_dir, 'Packages'), 'w').close()
+    results = []
+    try:
+        for name, arguments in commands(repo_path):
+            best, median = measure(arguments, runs)
+            results.append({'phase': name, 'seconds': round(median, 6), 'best': round(best, 6)})
+            print('%-20s %9.1fms %9.1fms' % (name, best * 1000, median * 1000))
+    finally:
+        shutil.rmtree(repo_path, ignore_errors=True)
+    return {'parameters': {'runs': runs},
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'results': results}
+
+
+def compare(report, baseline):
+    """
+    Print the median time of every command against a previous run
+    """
+    previous = dict((result['phase'], result) for result in baseline['results'])
+    print('%-20s %10s %10s %8s' % ('command', 'before', 'after', 'ratio'))
+    for result in report['results']:
+        old = previous.get(result['phase'])
+        if old is None:
+            continue
+        ratio = result['seconds'] / old['seconds'] if old['seconds'] else float('inf')
+        print('%-20s %8.1fms %8.1fms %7.2fx' % (result['phase'], old['seconds'] * 1000, result['seconds'] * 1000,
+                                                ratio))
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark the tinP command line startup.')
+    parser.add_argument('--runs', type=int, default=20, help='runs of every command (default 20)')
+    parser.add_argument('--output', help='write the results to this json file')
+    parser.add_argument('--compare', help='json results of a previous run to compare with')
+    args = parser.parse_args()
+
+    print('%-20s %11s %11s' % ('command', 'best', 'median'))
+    report = run(args.runs)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
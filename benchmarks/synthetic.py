@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# synthetic.py
+#
+# Copyright 2014 Carlos Cesar Caballero Diaz <ccesar@linuxmail.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+"""
+Synthetic Debian repositories for benchmarks, usable through file: urls
+
+    python benchmarks/synthetic.py /tmp/bench-repo --packages 20000
+"""
+
+from __future__ import absolute_import, print_function
+
+__author__ = 'cccaballero'
+
+import os
+import sys
+import gzip
+import random
+import hashlib
+from io import BytesIO
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+SECTIONS = ('admin', 'devel', 'libs', 'net', 'utils', 'web')
+
+
+def package_version(index, revision):
+    return '1.%d-%d' % (index, revision)
+
+
+def _write(path, data):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _gzip(data):
+    buffer = BytesIO()
+    f = gzip.GzipFile(fileobj=buffer, mode='wb', mtime=0)
+    f.write(data)
+    f.close()
+    return buffer.getvalue()
+
+
+def generate_repository(path, packages=1000, fanout=3, provides=0.05, deb_size=4096, dist='bench',
+                        component='main', arch='binary-amd64', revision=1, upgrade_fraction=0.0, seed=1):
+    """
+    Write a synthetic repository: .deb files of synthetic contents, the
+    Packages index (plain, gz and xz) and a Release file
+    :param path: repository root directory
+    :param packages: number of packages
+    :param fanout: mean number of Depends of every package
+    :param provides: fraction of packages providing a virtual package
+    :param deb_size: mean size of the .deb files in bytes
+    :param revision: Debian revision of the upgraded packages
+    :param upgrade_fraction: fraction of packages at the given revision,
+        the rest stay at revision 1, used to generate upgrades of a
+        repository generated before
+    :param seed: random seed, the same parameters always give the same repository
+    :return: sources.list line of the repository
+    """
+    rng = random.Random(seed)
+    upgrade_rng = random.Random(seed + revision)
+    virtuals = max(1, int(packages * provides / 3))
+    stanzas = []
+    for index in range(packages):
+        name = 'pkg%d' % index
+        package_revision = revision if upgrade_rng.random() < upgrade_fraction else 1
+        version = package_version(index, package_revision)
+        filename = 'pool/%s/p/%s/%s_%s_%s.deb' % (component, name, name, version, arch.replace('binary-', ''))
+        size = max(1, int(rng.expovariate(1.0 / deb_size)))
+        data = (('%s %s ' % (name, version)).encode('ascii') * (size // 8 + 1))[:size]
+        deb_path = os.path.join(path, filename)
+        if not os.path.exists(deb_path):
+            _write(deb_path, data)
+        lines = ['Package: %s' % name,
+                 'Version: %s' % version,
+                 'Architecture: %s' % arch.replace('binary-', ''),
+                 'Section: %s' % SECTIONS[index % len(SECTIONS)],
+                 'Priority: optional']
+        depends_count = min(packages - 1, int(rng.expovariate(1.0 / fanout))) if fanout else 0
+        depends = []
+        for dependency in rng.sample(range(packages), depends_count):
+            if dependency == index:
+                continue
+            if rng.random() < provides:
+                depends.append('virtual%d | pkg%d' % (dependency % virtuals, dependency))
+            else:
+                depends.append('pkg%d (>= 1.%d)' % (dependency, dependency))
+        if depends:
+            lines.append('Depends: %s' % ', '.join(depends))
+        if rng.random() < fanout / 10.0:
+            lines.append('Recommends: pkg%d' % rng.randrange(packages))
+        if rng.random() < provides:
+            lines.append('Provides: virtual%d' % rng.randrange(virtuals))
+        lines += ['Filename: %s' % filename,
+                  'Size: %d' % size,
+                  'SHA256: %s' % hashlib.sha256(data).hexdigest(),
+                  'Description: synthetic package %d' % index,
+                  ' generated for tinP benchmarks.']
+        stanzas.append('\n'.join(lines) + '\n')
+    index = '\n'.join(stanzas).encode('utf-8')
+
+    index_dir = os.path.join('dists', dist, component, arch)
+    variants = {'Packages': index, 'Packages.gz': _gzip(index)}
+    if lzma is not None:
+        variants['Packages.xz'] = lzma.compress(index)
+    release = ['Suite: %s' % dist, 'Codename: %s' % dist, 'Components: %s' % component,
+               'Architectures: %s' % arch.replace('binary-', ''), 'SHA256:']
+    for name in sorted(variants):
+        _write(os.path.join(path, index_dir, name), variants[name])
+        release.append(' %s %16d %s/%s/%s' % (hashlib.sha256(variants[name]).hexdigest(), len(variants[name]),
+                                               component, arch, name))
+    _write(os.path.join(path, 'dists', dist, 'Release'), ('\n'.join(release) + '\n').encode('utf-8'))
+    return 'deb file:%s %s %s' % (os.path.abspath(path), dist, component)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Generate a synthetic Debian repository for benchmarks.')
+    parser.add_argument('path', help='repository root directory')
+    parser.add_argument('--packages', type=int, default=1000, help='number of packages (default 1000)')
+    parser.add_argument('--fanout', type=float, default=3, help='mean Depends per package (default 3)')
+    parser.add_argument('--provides', type=float, default=0.05,
+                        help='fraction of packages providing a virtual package (default 0.05)')
+    parser.add_argument('--deb-size', type=int, default=4096, help='mean .deb size in bytes (default 4096)')
+    parser.add_argument('--revision', type=int, default=1, help='Debian revision of upgraded packages')
+    parser.add_argument('--upgrade-fraction', type=float, default=0.0,
+                        help='fraction of packages at --revision (default 0)')
+    parser.add_argument('--seed', type=int, default=1, help='random seed (default 1)')
+    args = parser.parse_args()
+    print(generate_repository(args.path, args.packages, args.fanout, args.provides, args.deb_size,
+                              revision=args.revision, upgrade_fraction=args.upgrade_fraction, seed=args.seed))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
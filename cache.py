@@ -0,0 +1,395 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# cache.py
+#
+# Copyright 2014 Carlos Cesar Caballero Diaz <ccesar@linuxmail.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+__author__ = 'cccaballero'
+
+import os
+import sys
+import json
+import time
+import pickle
+import hashlib
+import tempfile
+import threading
+from contrib.unwrapt import Download
+from parsers import parse_release
+import stats
+if sys.version >= '3':
+    from urllib.parse import quote
+else:
+    from urllib import quote
+
+
+def default_cache_dir():
+    """
+    Return the default directory for the tinP cache
+    """
+    base = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(base, 'tinp')
+
+
+def _local_path(url):
+    return url.replace('file:', '', 1).replace('%20', ' ')
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    f = open(path, 'rb')
+    for block in iter(lambda: f.read(65536), b''):
+        digest.update(block)
+    f.close()
+    return digest.hexdigest()
+
+
+def _pickle_load(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _temporary(path, mode='wb'):
+    """
+    Open a uniquely named temporary file next to path, renamed over it
+    once complete (see _commit)
+    :return: (file object, temporary path) tuple
+    """
+    fd, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.%s.' % os.path.basename(path),
+                                          suffix='.part')
+    return os.fdopen(fd, mode), temporary_path
+
+
+def _commit(temporary_path, path):
+    os.rename(temporary_path, path)
+
+
+def _discard(temporary_path):
+    try:
+        os.remove(temporary_path)
+    except OSError:
+        pass
+
+
+def _write_atomic(path, write, mode='wb'):
+    """
+    Write a file through a temporary file, readers never see it half written
+    :param write: callable receiving the open file
+    """
+    f, temporary_path = _temporary(path, mode)
+    try:
+        with f:
+            write(f)
+        _commit(temporary_path, path)
+    except:
+        _discard(temporary_path)
+        raise
+
+
+def _pickle_save(parsed, path):
+    _write_atomic(path, lambda f: pickle.dump(parsed, f, pickle.HIGHEST_PROTOCOL))
+
+
+class IndexCache(object):
+
+    def __init__(self, path=None, max_age=0):
+        """
+        Persistent cache of repository indexes. Every entry keeps the raw
+        index, its parsed form and the metadata used to tell whether the
+        index changed upstream: the Release hash, the ETag/Last-Modified
+        headers or, for local repositories, the file size and mtime
+        :param path: cache directory
+        :param max_age: seconds a remote index checked with its mirror is
+            taken as current without checking it again, 0 to always check
+        """
+        self.path = path or default_cache_dir()
+        self.max_age = max_age
+        self.releases = {}
+        self.validators = {}
+        self.lock = threading.Lock()
+        self.entry_locks = {}
+
+    def _entry_lock(self, url):
+        """
+        Return the lock of a cache entry, held while the entry is fetched or
+        written so threads asking for the same url wait for a single fetch
+        """
+        with self.lock:
+            return self.entry_locks.setdefault(url, threading.Lock())
+
+    def _entry(self, url):
+        entry = os.path.join(self.path, quote(url, safe=''))
+        try:
+            os.makedirs(entry)
+        except OSError:
+            pass
+        return entry
+
+    def _read_meta(self, entry):
+        try:
+            with open(os.path.join(entry, 'meta')) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def _load(self, entry, load):
+        """
+        Return the cached parsed form, None if missing or unreadable
+        """
+        try:
+            return load(os.path.join(entry, 'parsed'))
+        except Exception:
+            return None
+
+    def _write_meta(self, entry, meta):
+        _write_atomic(os.path.join(entry, 'meta'), lambda f: json.dump(meta, f), 'w')
+
+    def _store(self, entry, meta, parsed, save):
+        save(parsed, os.path.join(entry, 'parsed'))
+        self._write_meta(entry, meta)
+
+    def _is_fresh(self, entry, meta):
+        """
+        Tell whether a remote entry was checked less than max_age seconds ago
+        """
+        if not self.max_age or not os.path.exists(os.path.join(entry, 'index')):
+            return False
+        return time.time() - meta.get('checked', 0) < self.max_age
+
+    def _checked(self, entry, meta):
+        """
+        Record that the mirror still serves the cached copy of an entry
+        """
+        meta = dict(meta, checked=time.time())
+        self._write_meta(entry, meta)
+        return meta
+
+    def _remember(self, url, meta):
+        """
+        Keep the validator of an index served in this run, see key_for
+        """
+        with self.lock:
+            self.validators[url] = meta.get('validator') or meta.get('etag') or meta.get('last_modified')
+
+    def _fetch(self, url, entry, meta, consume=None):
+        """
+        Conditionally download an url into the entry raw index
+        :param consume: optional callable receiving every downloaded block
+        :return: (downloaded, response) tuple, downloaded is False when the
+            cached copy is still current
+        """
+        index_path = os.path.join(entry, 'index')
+        headers = {}
+        if os.path.exists(index_path):
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+        session = Download.get_session()
+        key, connection, response = session.open(url, headers)
+        try:
+            if response.status == 304:
+                response.read()
+                return False, response
+            if response.status >= 400:
+                response.read()
+                raise IOError("HTTP error %s: %s" % (response.status, url))
+            display = url.rsplit('/', 1)[1]
+            length = int(response.getheader('Content-Length') or 0)
+            downloaded = 0
+            f, temporary_path = _temporary(index_path)
+            try:
+                with f:
+                    while 1:
+                        data = response.read(65536)
+                        if not data:
+                            break
+                        downloaded += len(data)
+                        f.write(data)
+                        if consume is not None:
+                            consume(data)
+                        Download.textprogress(display, downloaded, max(length, downloaded))
+            except:
+                _discard(temporary_path)
+                raise
+        except:
+            connection.close()
+            raise
+        session.release(key, connection)
+        _commit(temporary_path, index_path)
+        return True, response
+
+    def release_files(self, release_url):
+        """
+        Return the files listed in a Release file, fetched once per run
+        :param release_url: Release file url
+        :return: dictionary of file name and (SHA256, size), empty if there is no Release
+        """
+        with self.lock:
+            if release_url in self.releases:
+                return self.releases[release_url]
+        with self._entry_lock(release_url):
+            # another thread may have fetched it while this one waited
+            with self.lock:
+                if release_url in self.releases:
+                    return self.releases[release_url]
+            files = self._release_files(release_url)
+            with self.lock:
+                self.releases[release_url] = files
+        return files
+
+    def _release_files(self, release_url):
+        files = {}
+        for url in (release_url, release_url[:-len('Release')] + 'InRelease'):
+            if url.startswith('file:'):
+                try:
+                    with open(_local_path(url), 'rb') as f:
+                        files = parse_release(f.read().decode('utf-8', 'replace'))
+                except IOError:
+                    continue
+                break
+            entry = self._entry(url)
+            meta = self._read_meta(entry)
+            if not self._is_fresh(entry, meta):
+                try:
+                    downloaded, response = self._fetch(url, entry, meta)
+                except IOError:
+                    continue
+                if downloaded:
+                    meta = {'etag': response.getheader('ETag'),
+                            'last_modified': response.getheader('Last-Modified')}
+                self._checked(entry, meta)
+            with open(os.path.join(entry, 'index'), 'rb') as f:
+                files = parse_release(f.read().decode('utf-8', 'replace'))
+            break
+        return files
+
+    def get(self, url, parse, release=None, load=_pickle_load, save=_pickle_save, stream=None):
+        """
+        Return the parsed form of an index, downloading and parsing it only
+        if it changed since it was cached
+        :param url: index url
+        :param parse: callable building the parsed form from a local index path
+        :param release: optional (Release url, index name in the Release) tuple
+        :param stream: optional callable returning an object with feed(block)
+            and close() methods, downloaded indexes are parsed with it while
+            they arrive instead of with parse afterwards
+        :param load: callable reading the parsed form from a path
+        :param save: callable writing the parsed form to a path, atomically
+        :return: parsed index
+        """
+        with self._entry_lock(url):
+            return self._get(url, parse, release, load, save, stream)
+
+    def _get(self, url, parse, release, load, save, stream):
+        entry = self._entry(url)
+        meta = self._read_meta(entry)
+        parsed = None
+
+        if url.startswith('file:'):
+            index_path = _local_path(url)
+            stat = os.stat(index_path)
+            validator = 'stat:%d:%d' % (stat.st_size, stat.st_mtime)
+            if meta.get('validator') == validator:
+                parsed = self._load(entry, load)
+            if parsed is None:
+                stats.count('index.parsed')
+                parsed = parse(index_path)
+                self._store(entry, {'validator': validator}, parsed, save)
+            else:
+                stats.count('index.cache_hits')
+            self._remember(url, {'validator': validator})
+            return parsed
+
+        if self._is_fresh(entry, meta):
+            parsed = self._load(entry, load)
+            if parsed is not None:
+                stats.count('index.cache_hits')
+                self._remember(url, meta)
+                return parsed
+        validator = None
+        if release:
+            release_url, index_name = release
+            validator = self.release_files(release_url).get(index_name, (None,))[0]
+            if validator and meta.get('validator') == validator:
+                parsed = self._load(entry, load)
+                if parsed is not None:
+                    stats.count('index.cache_hits')
+                    self._remember(url, meta)
+                    return parsed
+        index_stream = stream() if stream is not None else None
+        downloaded, response = self._fetch(url, entry, meta,
+                                           index_stream.feed if index_stream is not None else None)
+        index_path = os.path.join(entry, 'index')
+        if not downloaded:
+            stats.count('index.cache_hits')
+            parsed = self._load(entry, load)
+            if parsed is None:
+                parsed = parse(index_path)
+                self._store(entry, meta, parsed, save)
+            self._remember(url, self._checked(entry, meta))
+            return parsed
+        stats.count('index.fetched')
+        if validator and _file_sha256(index_path) != validator:
+            # mirror in the middle of a sync, do not trust the Release hash
+            validator = None
+        parsed = index_stream.close() if index_stream is not None else parse(index_path)
+        meta = {'validator': validator,
+                'etag': response.getheader('ETag'),
+                'last_modified': response.getheader('Last-Modified'),
+                'checked': time.time()}
+        self._store(entry, meta, parsed, save)
+        self._remember(url, meta)
+        return parsed
+
+    def key_for(self, urls):
+        """
+        Return a key identifying the current contents of a group of indexes
+        served by this cache, for caching data derived from all of them
+        :param urls: index urls, in the order their contents were combined
+        :return: key string, None if some index has no validator
+        """
+        digest = hashlib.sha256()
+        with self.lock:
+            for url in urls:
+                validator = self.validators.get(url)
+                if not validator:
+                    return None
+                digest.update(('%s %s\n' % (url, validator)).encode('utf-8'))
+        return digest.hexdigest()
+
+    def derived(self, name, key, build, load=_pickle_load, save=_pickle_save):
+        """
+        Return data derived from cached indexes, building it only when the
+        key changed since it was saved
+        :param name: name of the derived data
+        :param key: key of the data it is derived from (see key_for)
+        :param build: callable building the data
+        :return: derived data
+        """
+        with self._entry_lock('derived:%s' % name):
+            entry = self._entry('derived:%s' % name)
+            meta = self._read_meta(entry)
+            if meta.get('validator') == key:
+                derived = self._load(entry, load)
+                if derived is not None:
+                    return derived
+            derived = build()
+            self._store(entry, {'validator': key}, derived, save)
+            return derived
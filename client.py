@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# client.py
+#
+# Copyright 2014 Carlos Cesar Caballero Diaz <ccesar@linuxmail.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+__author__ = 'cccaballero'
+
+import sys
+import json
+if sys.version >= '3':
+    from urllib.request import urlopen, Request
+    from urllib.error import HTTPError
+else:
+    from urllib2 import urlopen, Request, HTTPError
+
+
+class ServiceError(Exception):
+    """
+        The tinP service could not run a request
+    """
+    pass
+
+
+class ServiceClient(object):
+
+    def __init__(self, url, timeout=None):
+        """
+        Client of a tinP service (see service.py), it only needs the
+        standard library so it starts at once
+        :param url: service url (ex: "http://127.0.0.1:8642")
+        :param timeout: seconds to wait for an answer, None to wait until the request is done
+        """
+        if '://' not in url:
+            url = 'http://' + url
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def request(self, action, **params):
+        """
+        Run an action in the service
+        :param action: action name (add, add_section, remove, gc, upgrade, resume, search, query, why, refresh,
+            status)
+        :param params: action arguments
+        :return: action result
+        """
+        request = Request('%s/%s' % (self.url, action), json.dumps(params).encode('utf-8'),
+                          {'Content-Type': 'application/json'})
+        try:
+            response = urlopen(request, timeout=self.timeout)
+        except HTTPError as e:
+            try:
+                message = json.loads(e.read().decode('utf-8'))['error']
+            except (ValueError, KeyError):
+                message = str(e)
+            raise ServiceError(message)
+        except (IOError, OSError) as e:
+            raise ServiceError('%s: %s' % (self.url, e))
+        return json.loads(response.read().decode('utf-8'))['result']
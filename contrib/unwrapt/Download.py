@@ -17,20 +17,24 @@
 
 import os
 import sys
+import time
+import base64
+import threading
 import urllib
-# import httplib
 if sys.version >= '3':    
     import urllib.parse as urlparse
+    import http.client as httplib
     from urllib.request import FancyURLopener
     from . import utils
 else:
     import urlparse
+    import httplib
     from urllib import FancyURLopener
     import utils
 
 
 from datetime import datetime
-
+from email.utils import formatdate, parsedate_tz, mktime_tz
 
 # from utils import format_number
 
@@ -38,10 +42,25 @@ from shutil import copyfile
 from shutil import copy2
 
 
-#TODO: Add resume support: http://code.activestate.com/recipes/83208-resuming-download-of-a-file/
-
 _FILE_URI_PREFIX = 'file:'
-_HTTP_URI_PREFIX = 'http:'
+_HTTP_URI_PREFIXES = ('http:', 'https:')
+
+
+class NoRecorder(object):
+    """
+        Default download recorder, counts and times are dropped. A recorder
+        has the count(name, value) and add_time(name, seconds) methods of
+        the application stats module
+    """
+
+    def count(self, name, value=1):
+        pass
+
+    def add_time(self, name, seconds):
+        pass
+
+
+_no_recorder = NoRecorder()
 
 
 class InvalidCredentials(Exception):
@@ -97,81 +116,239 @@ def textprogress(display, current, total):
     sys.stdout.flush()
 
 
-def download_url(url, filename, display=None, progress=textprogress, proxy={}, username=None, password=None):
+class DownloadSession(object):
+    """
+        Keeps HTTP connections alive per host (or proxy) and reuses them
+        across downloads. It is safe to share a session between threads,
+        every thread takes its own connection from the pool.
     """
-        Downloads a file to ram and returns a string of the contents
+
+    max_redirects = 5
+
+    def __init__(self, proxy={}, usr=None, pwd=None, timeout=60):
+        self.proxy = proxy
+        self.usr = usr
+        self.pwd = pwd
+        self.timeout = timeout
+        self.idle = {}
+        self.lock = threading.Lock()
+
+    def _route(self, url):
+        """
+            Return the connection key and the request path for an url
+        """
+        parts = urlparse.urlsplit(url)
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        proxy = self.proxy.get(parts.scheme)
+        if proxy:
+            proxy_parts = urlparse.urlsplit(proxy)
+            key = (parts.scheme, proxy_parts.hostname, proxy_parts.port or 80, parts.hostname, port)
+            # https goes through a CONNECT tunnel, http sends the full url to the proxy
+            path = url if parts.scheme == 'http' else None
+        else:
+            key = (parts.scheme, parts.hostname, port, None, None)
+            path = None
+        if path is None:
+            path = parts.path or '/'
+            if parts.query:
+                path += '?' + parts.query
+        return key, path
+
+    def _connect(self, key):
+        scheme, host, port, tunnel_host, tunnel_port = key
+        if scheme == 'https' and not tunnel_host:
+            return httplib.HTTPSConnection(host, port, timeout=self.timeout)
+        if scheme == 'https':
+            connection = httplib.HTTPSConnection(host, port, timeout=self.timeout)
+            connection.set_tunnel(tunnel_host, tunnel_port, self._proxy_headers())
+            return connection
+        return httplib.HTTPConnection(host, port, timeout=self.timeout)
+
+    def _proxy_headers(self):
+        if self.usr is None:
+            return {}
+        credentials = ('%s:%s' % (self.usr, self.pwd or '')).encode('utf-8')
+        return {'Proxy-Authorization': 'Basic ' + base64.b64encode(credentials).decode('ascii')}
+
+    def _acquire(self, key):
+        with self.lock:
+            connections = self.idle.get(key)
+            if connections:
+                return connections.pop(), True
+        return self._connect(key), False
+
+    def release(self, key, connection):
+        """
+            Give back a connection whose last response was fully read
+        """
+        with self.lock:
+            self.idle.setdefault(key, []).append(connection)
+
+    def close(self):
+        with self.lock:
+            for connections in self.idle.values():
+                for connection in connections:
+                    connection.close()
+            self.idle = {}
+
+    def open(self, url, headers={}):
+        """
+            Send a GET request following redirects
+            :return: (connection key, connection, response) tuple, the
+                connection must be given back with release() once the
+                response body has been read
+        """
+        for redirect in range(self.max_redirects + 1):
+            key, path = self._route(url)
+            request_headers = dict(headers)
+            if key[3] and key[0] == 'http':
+                request_headers.update(self._proxy_headers())
+            connection, reused = self._acquire(key)
+            try:
+                connection.request('GET', path, headers=request_headers)
+                response = connection.getresponse()
+            except (httplib.HTTPException, IOError):
+                connection.close()
+                if not reused:
+                    raise
+                # the server closed an idle keep-alive connection, retry on a new one
+                connection = self._connect(key)
+                connection.request('GET', path, headers=request_headers)
+                response = connection.getresponse()
+            if response.status == 407:
+                response.read()
+                connection.close()
+                raise InvalidCredentials("Unable to authenticate to proxy")
+            if response.status in (301, 302, 303, 307, 308) and response.getheader('Location'):
+                response.read()
+                self.release(key, connection)
+                url = urlparse.urljoin(url, response.getheader('Location'))
+                continue
+            return key, connection, response
+        raise IOError("Too many redirects: %s" % url)
+
+    def get(self, url, headers={}):
+        """
+            Return the status, headers and body of a GET request
+        """
+        key, connection, response = self.open(url, headers)
+        try:
+            body = response.read()
+        except:
+            connection.close()
+            raise
+        self.release(key, connection)
+        return response.status, response, body
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(proxy={}, username=None, password=None):
+    """
+        Return the shared download session for a proxy configuration
+    """
+    key = (tuple(sorted(proxy.items())), username, password)
+    with _sessions_lock:
+        if key not in _sessions:
+            _sessions[key] = DownloadSession(proxy, username, password)
+        return _sessions[key]
+
+
+def _set_modified_time(filename, page):
+    """
+        Give a (partially) downloaded file the Last-Modified time of the
+        response, it is sent back as If-Range to continue the download
+    """
+    modified = page.getheader("Last-Modified")
+    parsed = parsedate_tz(modified) if modified else None
+    if parsed is None:
+        return
+    timestamp = mktime_tz(parsed)
+    os.utime(filename, (timestamp, timestamp))
+
+def download_url(url, filename, display=None, progress=textprogress, proxy={}, username=None, password=None,
+                 session=None, recorder=_no_recorder):
+    """
+        Downloads an url to a file, continuing a partial download if the
+        remote file was not modified since then
+        :param recorder: receives the transfer counters (see NoRecorder)
     """
     
     if not display:
         display = url.rsplit("/", 1)[1]
+    if session is None:
+        session = get_session(proxy, username, password)
 
-    # Do we already have a file to continue off of?
-    # modified determines whether the file is outdated or not based on headers
-    modified = None
+    # Do we already have a file to continue off of? A single ranged request
+    # replaces the old header probe: the server answers 206 if our copy is
+    # still current (If-Range), 200 with the whole file if it is outdated
+    # and 416 if there is nothing left to fetch
     downloaded = 0
+    headers = {}
     if os.path.exists(filename):
-        modified = datetime.utcfromtimestamp(os.stat(filename).st_mtime)
         downloaded = os.path.getsize(filename)
-
-    # Open up a temporary connection to see if the file we have downloaded
-    # is still usable (based on modification date)
-    # format meanings are located http://docs.python.org/library/time.html
-    opener = ProxyOpener(proxy, username, password)
-    headers = opener.open(url).headers
-
-    if modified and "Last-Modified" in headers:
-        dt = datetime.strptime(headers["Last-Modified"],
-                                        "%a, %d %b %Y %H:%M:%S %Z")
-       
-        # File is too old so we delete the old file 
-        if modified < dt:
-            #logging.debug("OLD FILE")
-            #print "OLD FILE"
-            downloaded = 0
-            os.remove(filename)
-
-    # Test existing filesize compared to length of download
-    if "Content-Length" in headers:
-        length = int(headers["Content-Length"])
-
-        # File already downloaded?
-        if downloaded == length:
+    if downloaded:
+        # the modification time of a partial file is the Last-Modified time
+        # of the response it came from (see _set_modified_time), a partial
+        # file without it gets the whole file again
+        headers["Range"] = "bytes=%s-" % str(downloaded)
+        headers["If-Range"] = formatdate(os.stat(filename).st_mtime, usegmt=True)
+
+    key, connection, page = session.open(url, headers)
+    if page.status >= 400:
+        page.read()
+        session.release(key, connection)
+        if page.status != 416:
+            raise IOError("HTTP error %s: %s" % (page.status, url))
+        length = int(page.getheader("Content-Range", "*/-1").rsplit("/", 1)[1])
+        if length == downloaded:
+            recorder.count("download.hits")
             progress("Hit: %s" % display, length, length)
             return
-
-        # File corrupted?
-        elif downloaded > length:
+        # File corrupted? fetch it again from the start
+        os.remove(filename)
+        return download_url(url, filename, display, progress, session=session, recorder=recorder)
+
+    try:
+        transferred = 0
+        if page.status == 206:
+            mode = "ab"
+        else:
+            mode = "wb"
             downloaded = 0
-            os.remove(filename)
-
-    # Open up the real connection for downloading
-    opener = ProxyOpener(proxy, username, password)
-    if downloaded:
-        opener.addheader("Range", "bytes=%s-" % str(downloaded))
-    page = opener.open(url)
 
-    # The file range must have matched the download size
-    if not "Content-Length" in page.headers:
-        progress("Hit: %s" % display, downloaded, downloaded)
-        return
-
-    # Finish downloading the file
-    length = int(page.headers["Content-Length"]) + downloaded
-    f = open(filename, "ab")
-
-    while 1:
-        data = page.read(8192)
-        if not data:
-            break
-        downloaded += len(data)
-        f.write(data)
-        progress(display, downloaded, length)
-    f.close()
-    page.close()
+        # Finish downloading the file
+        length = page.getheader("Content-Length")
+        length = int(length) + downloaded if length is not None else 0
+        f = open(filename, mode)
+        try:
+            while 1:
+                data = page.read(8192)
+                if not data:
+                    break
+                downloaded += len(data)
+                transferred += len(data)
+                f.write(data)
+                progress(display, downloaded, length or downloaded)
+        finally:
+            f.close()
+            _set_modified_time(filename, page)
+    except:
+        recorder.count("download.bytes", transferred)
+        connection.close()
+        raise
+    recorder.count("download.bytes", transferred)
+    recorder.count("download.fetched")
+    if page.will_close:
+        connection.close()
+    else:
+        session.release(key, connection)
 
     return
 
-def download_file(url, filename, display=None, progress=textprogress):
+def download_file(url, filename, display=None, progress=textprogress, recorder=_no_recorder):
     """
         copy a file
     """
@@ -181,18 +358,144 @@ def download_file(url, filename, display=None, progress=textprogress):
     #print "download_file: "+url+" file: "+filename
     file_path = url.replace('file:', '')
     file_path = file_path.replace('%20', ' ')
-    file_size = os.stat(file_path).st_size
+    file_stat = os.stat(file_path)
+    file_size = file_stat.st_size
+    # copy2 keeps the modification time, a copy with the same size and
+    # mtime is already up to date
+    if os.path.exists(filename):
+        stat = os.stat(filename)
+        if stat.st_size == file_size and int(stat.st_mtime) == int(file_stat.st_mtime):
+            recorder.count("download.hits")
+            progress("Hit: %s" % display, file_size, file_size)
+            return
     # copyfile(file_path, filename)
     copy2(file_path, filename)
+    recorder.count("download.bytes", file_size)
+    recorder.count("download.fetched")
     progress(display, file_size, file_size)
     
     return
 
-def download(url, filename, display=None, progress=textprogress, proxy={}, username=None, password=None):
+def download_stream(url, consume, display=None, progress=textprogress, proxy={}, username=None, password=None,
+                    session=None, block_size=65536, recorder=_no_recorder):
+    """
+        Read an url block by block passing every block to consume, nothing
+        is written to disk
+        :param recorder: receives the transfer counters (see NoRecorder)
+    """
+
+    if not display:
+        display = url.rsplit("/", 1)[1]
     if url.startswith(_FILE_URI_PREFIX):
-        download_file(url, filename)
-    elif url.startswith(_HTTP_URI_PREFIX):
-        download_url(url, filename, display, progress, proxy, username, password)
+        file_path = url.replace('file:', '', 1).replace('%20', ' ')
+        length = os.path.getsize(file_path)
+        f = open(file_path, "rb")
+        try:
+            downloaded = 0
+            for data in iter(lambda: f.read(block_size), b""):
+                downloaded += len(data)
+                consume(data)
+                if progress:
+                    progress(display, downloaded, length)
+        finally:
+            f.close()
+            recorder.count("download.bytes", downloaded)
+        return
+
+    if session is None:
+        session = get_session(proxy, username, password)
+    key, connection, page = session.open(url)
+    downloaded = 0
+    try:
+        if page.status >= 400:
+            page.read()
+            raise IOError("HTTP error %s: %s" % (page.status, url))
+        length = int(page.getheader("Content-Length") or 0)
+        while 1:
+            data = page.read(block_size)
+            if not data:
+                break
+            downloaded += len(data)
+            consume(data)
+            if progress:
+                progress(display, downloaded, max(length, downloaded))
+    except:
+        connection.close()
+        raise
+    finally:
+        recorder.count("download.bytes", downloaded)
+    if page.will_close:
+        connection.close()
+    else:
+        session.release(key, connection)
+
+def download(url, filename, display=None, progress=textprogress, proxy={}, username=None, password=None,
+             session=None, recorder=_no_recorder):
+    start = time.time()
+    try:
+        if url.startswith(_FILE_URI_PREFIX):
+            download_file(url, filename, display, progress, recorder)
+        elif url.startswith(_HTTP_URI_PREFIXES):
+            download_url(url, filename, display, progress, proxy, username, password, session, recorder)
+        else:
+            raise IOError("Unsupported url scheme: %s" % url)
+    finally:
+        recorder.add_time("download", time.time() - start)
+
+
+class AggregateProgress(object):
+    """
+        Overall progress of a group of concurrent downloads in terminal
+    """
+
+    def __init__(self, total_files, total_bytes=0, display="Downloading"):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.display = display
+        self.done_files = 0
+        self.done_bytes = 0
+        self.lock = threading.Lock()
+
+    def file_progress(self, size=0):
+        """
+            Return a progress callback for a single file of the group, the
+            same callback is used by every attempt of the file: current is
+            the offset reached in the file, a retry starting over or
+            resuming moves it back or forward instead of adding to it
+            :param size: expected size of the file, already counted in total_bytes
+        """
+        state = {"current": 0, "total": size}
+
+        def progress(display, current, total):
+            with self.lock:
+                self.done_bytes += current - state["current"]
+                # the real size is only known once the transfer starts
+                if total and total != state["total"]:
+                    self.total_bytes += total - state["total"]
+                    state["total"] = total
+                state["current"] = current
+                self.show()
+
+        return progress
+
+    def file_done(self):
+        with self.lock:
+            self.done_files += 1
+            self.show()
+
+    def show(self):
+        total = max(self.total_bytes, self.done_bytes, 1)
+        sys.stdout.write("\r%-36.36s %5i/%-5i %3i%% [%5sB / %5sB]" % \
+            (self.display,
+             self.done_files,
+             self.total_files,
+             self.done_bytes/float(total) * 100,
+             utils.format_number(self.done_bytes),
+             utils.format_number(total)))
+        if self.done_files == self.total_files:
+            sys.stdout.write("\n")
+        sys.stdout.flush()
+
 
 # ##Check for Valid URL based on the HTTP response code
 # def httpExists(url):
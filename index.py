@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# index.py
+#
+# Copyright 2014 Carlos Cesar Caballero Diaz <ccesar@linuxmail.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+__author__ = 'cccaballero'
+
+from fnmatch import fnmatchcase
+from parsers import get_section_index
+from resolver import relation_names, REQUIRED_RELATIONS
+
+# bump when the PackageIndex layout changes, older cached indexes are rebuilt
+INDEX_VERSION = 1
+
+
+class PackageIndex(object):
+
+    def __init__(self, depends=None, rdepends=None, providers=None, sections=None):
+        """
+        Precomputed lookups over a packages dictionary: forward and reverse
+        dependencies, providers of virtual packages and packages by section.
+        Every lookup is a dictionary access returning a tuple of package names
+        :param depends: dictionary of package name and names it depends on
+        :param rdepends: dictionary of package (or virtual) name and names depending on it
+        :param providers: dictionary of virtual name and names providing it
+        :param sections: dictionary of section and package names
+        """
+        self.forward = depends or {}
+        self.reverse = rdepends or {}
+        self.provides = providers or {}
+        self.section_packages = sections or {}
+
+    @classmethod
+    def from_packages(cls, packages):
+        """
+        Build the index of a packages dictionary, virtual names are skipped
+        :param packages: dictionary of package name and package object
+        :return: PackageIndex
+        """
+        depends = {}
+        rdepends = {}
+        providers = {}
+        sections = {}
+        for name in packages:
+            package = packages[name]
+            if package['Package'] != name:
+                continue
+            names = []
+            for kind in REQUIRED_RELATIONS:
+                for group in relation_names(package, kind):
+                    for dependency in group:
+                        if dependency not in names:
+                            names.append(dependency)
+            depends[name] = tuple(names)
+            for dependency in names:
+                rdepends.setdefault(dependency, []).append(name)
+            for group in relation_names(package, 'provides'):
+                for virtual in group:
+                    providers.setdefault(virtual, []).append(name)
+            section = package.get('Section')
+            if section:
+                sections.setdefault(section, []).append(name)
+        return cls(depends,
+                   dict((name, tuple(names)) for name, names in rdepends.items()),
+                   dict((name, tuple(names)) for name, names in providers.items()),
+                   dict((name, tuple(names)) for name, names in sections.items()))
+
+    def depends(self, package_name):
+        """
+        Return the names a package depends on (all the alternatives)
+        """
+        return self.forward.get(package_name, ())
+
+    def rdepends(self, package_name):
+        """
+        Return the names of the packages depending on a package or virtual package
+        """
+        return self.reverse.get(package_name, ())
+
+    def providers(self, virtual_name):
+        """
+        Return the names of the packages providing a virtual package
+        """
+        return self.provides.get(virtual_name, ())
+
+    def section(self, section_name):
+        """
+        Return the names of the packages of a section
+        """
+        return self.section_packages.get(section_name, ())
+
+    def sections(self):
+        """
+        Return the sections with packages
+        """
+        return list(self.section_packages)
+
+    def matching_sections(self, patterns):
+        """
+        Return the sections matching shell-style patterns, a pattern without
+        "/" is matched against the last part of the section name too, so
+        "python" selects "python" and "universe/python"
+        :param patterns: section names or patterns (ex: "utils", "universe/*", "*python")
+        :return: sorted section names
+        """
+        matched = []
+        for section in sorted(self.section_packages):
+            short_name = section.rsplit('/', 1)[-1]
+            for pattern in patterns:
+                if fnmatchcase(section, pattern) or ('/' not in pattern and fnmatchcase(short_name, pattern)):
+                    matched.append(section)
+                    break
+        return matched
+
+    def section_roots(self, patterns):
+        """
+        Return the packages of all the sections matching a group of
+        patterns, see matching_sections
+        :return: sorted package names, every one once
+        """
+        names = set()
+        for section in self.matching_sections(patterns):
+            names.update(self.section_packages[section])
+        return sorted(names)
+
+
+def get_package_index(packages, sections, arch='binary-i386', packages_index_filename='Packages.gz', cache=None):
+    """
+    Return the PackageIndex of packages loaded from repository sections,
+    reusing the one saved in the cache when none of the indexes changed
+    :param packages: packages dictionary returned by get_packages
+    :param sections: repository sections the packages were loaded from
+    :param cache: IndexCache the packages were loaded with, None to always build it
+    :return: PackageIndex
+    """
+    build = lambda: PackageIndex.from_packages(packages)
+    if cache is None:
+        return build()
+    urls = [get_section_index(section, arch, packages_index_filename, cache)[0] for section in sections]
+    key = cache.key_for(urls)
+    if key is None:
+        return build()
+    return cache.derived('package-index:%s' % arch, 'v%d:%s' % (INDEX_VERSION, key), build)
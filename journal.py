@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# journal.py
+#
+# Copyright 2014 Carlos Cesar Caballero Diaz <ccesar@linuxmail.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+__author__ = 'cccaballero'
+
+import os
+import json
+import shutil
+import threading
+from parsers import parse_packages_data
+
+
+class Journal(object):
+
+    def __init__(self, path):
+        """
+        Transaction journal of a tinP repository. The resolved packages of
+        an add or upgrade are written before anything is downloaded and
+        every completed file is appended to a log, so an interrupted run
+        can be resumed without resolving dependencies or fetching the
+        completed files again
+        :param path: journal directory
+        """
+        self.path = path
+        self.plan_path = os.path.join(path, 'plan.json')
+        self.done_path = os.path.join(path, 'done')
+        self.lock = threading.Lock()
+        self.done_file = None
+        self.done = set()
+        self.plan = None
+
+    def exists(self):
+        return os.path.exists(self.plan_path)
+
+    def begin(self, action, packages, roots=(), recommends=False, suggests=False, mirrors=None):
+        """
+        Start a transaction, replacing any unfinished one
+        :param action: name of the action (add, add_section, upgrade)
+        :param packages: package objects to add
+        :param roots: packages to record as roots once the transaction is committed
+        :param mirrors: optional dictionary of package Filename and list of alternative base urls
+        """
+        self.finish()
+        os.makedirs(self.path)
+        self.plan = {'action': action,
+                     'roots': list(roots),
+                     'recommends': recommends,
+                     'suggests': suggests,
+                     'packages': [{'base_url': package.base_url, 'stanza': package.dump()}
+                                  for package in packages],
+                     'mirrors': mirrors or {}}
+        with open(self.plan_path + '.part', 'w') as f:
+            json.dump(self.plan, f)
+        os.rename(self.plan_path + '.part', self.plan_path)
+
+    def load(self):
+        """
+        Load an unfinished transaction
+        """
+        with open(self.plan_path) as f:
+            self.plan = json.load(f)
+        try:
+            with open(self.done_path) as f:
+                self.done = set(line.rstrip('\n') for line in f if line.endswith('\n'))
+        except IOError:
+            self.done = set()
+
+    def packages(self):
+        """
+        Return the package objects of the transaction, in their original order
+        """
+        stanzas = {}
+        order = []
+        for entry in self.plan['packages']:
+            base_url = entry['base_url']
+            if base_url not in stanzas:
+                stanzas[base_url] = []
+            order.append((base_url, len(stanzas[base_url])))
+            stanza = entry['stanza']
+            stanzas[base_url].append(stanza if stanza.endswith('\n') else stanza + '\n')
+        stores = dict((base_url, parse_packages_data('\n'.join(stanzas[base_url]).encode('utf-8'), base_url))
+                      for base_url in stanzas)
+        return [stores[base_url].record(index) for base_url, index in order]
+
+    def mirrors(self):
+        """
+        Return the alternative base urls of the transaction files
+        """
+        return self.plan.get('mirrors', {})
+
+    def is_done(self, filename):
+        return filename in self.done
+
+    def mark_done(self, filename):
+        """
+        Record a completely downloaded file, the log is flushed at once
+        :param filename: package Filename field
+        """
+        with self.lock:
+            if self.done_file is None:
+                self.done_file = open(self.done_path, 'a')
+            self.done_file.write(filename + '\n')
+            self.done_file.flush()
+            self.done.add(filename)
+
+    def finish(self):
+        """
+        Remove the journal, once the transaction is committed or discarded
+        """
+        with self.lock:
+            if self.done_file is not None:
+                self.done_file.close()
+                self.done_file = None
+            self.done = set()
+            self.plan = None
+        shutil.rmtree(self.path, ignore_errors=True)
@@ -25,7 +25,7 @@ keys = {
 'adds packages and all their dependencies to the custom repository (ex: "apache2 scite")':'adiciona los paquetes con todas sus dependencias al repositorio personalizado (ej: "apache2 scite")',
 'origin repository source file (/etc/apt/sources.list by default)':'fichero de fuentes del repositorio de origen (/etc/apt/sources.list por defecto)',
 'define architecture (default "binary-i386")':'define la arquitectura ("binary-i386" por defecto)',
-'removes packages from the repo (ex: "apache2 scite") not remove dependencies':'elimina paquetes del repositorio (ej: "apache2 scite"), no elimina sus dependencias',
+'removes packages from the repo (ex: "apache2 scite") and the dependencies no other package needs':'elimina paquetes del repositorio (ej: "apache2 scite") y las dependencias que ningún otro paquete necesita',
 'Usage: ':'Modo de uso: ',
 'Options':'Opciones',
 'Arguments':'Argumentos',
@@ -36,4 +36,61 @@ keys = {
 'section[s]':'sección[es]',
 'show this help message and exit':'muestra este mensaje de ayuda y termina el programa',
 'show program\'s version number and exit':'muestra la version de la aplicación',
+'jobs':'trabajos',
+'number of simultaneous downloads (default 4)':'cantidad de descargas simultáneas (4 por defecto)',
+'cache_dir':'directorio_de_cache',
+'packages index cache directory (~/.cache/tinp by default)':'directorio de cache de los índices de paquetes (~/.cache/tinp por defecto)',
+'always download and parse the packages indexes':'siempre descarga y procesa los índices de paquetes',
+'pool_dir':'directorio_de_paquetes',
+'check the SHA256 of package files already in the repository, not only their size':'comprueba el SHA256 de los ficheros de paquetes que ya están en el repositorio, no solo su tamaño',
+'package pool shared by several custom repositories, files are hardlinked from it':'almacén de paquetes compartido por varios repositorios personalizados, los ficheros se enlazan desde él',
+'new':'nuevo',
+'not found in the origin repositories, kept':'no encontrado en los repositorios de origen, se mantiene',
+'%d to upgrade, %d new, %d not found':'%d para actualizar, %d nuevos, %d no encontrados',
+'%sB to download':'%sB para descargar',
+'with --upgrade, only show what would be upgraded and the size to download':'con --upgrade, solo muestra lo que se actualizaría y el tamaño a descargar',
+'removes the packages no explicitly added package needs':'elimina los paquetes que ningún paquete agregado explícitamente necesita',
+'Removing unused packages...':'Eliminando paquetes no utilizados...',
+'print transfer, parsing, resolution and index writing statistics at the end':'muestra al final estadísticas de transferencia, procesamiento, resolución y escritura del índice',
+'file':'fichero',
+'write the statistics to a json file':'escribe las estadísticas en un fichero json',
+'run under cProfile, save the profile to a file and print the slowest calls':'ejecuta con cProfile, guarda el perfil en un fichero y muestra las llamadas más lentas',
+'continue an interrupted add or upgrade without resolving or downloading again what was done':'continúa una adición o actualización interrumpida sin resolver ni descargar de nuevo lo que ya se hizo',
+'Discarding an unfinished transaction, use --resume to continue it instead':'Descartando una transacción sin terminar, use --resume para continuarla',
+'There is no unfinished transaction':'No hay ninguna transacción sin terminar',
+'Resuming the unfinished transaction...':'Continuando la transacción sin terminar...',
+'maximum simultaneous downloads from a single host (no limit by default)':'cantidad máxima de descargas simultáneas desde un mismo servidor (sin límite por defecto)',
+'retries':'reintentos',
+'times every mirror of a file is tried before giving up (default 3)':'veces que se intenta cada réplica de un fichero antes de desistir (3 por defecto)',
+'rate':'velocidad',
+'maximum total download speed in bytes per second (ex: "500k", "2M")':'velocidad total máxima de descarga en bytes por segundo (ej: "500k", "2M")',
+'Invalid download rate: %s':'Velocidad de descarga no válida: %s',
+'arch[s]':'arquitectura[s]',
+'define architecture[s], built in a single run (ex: "binary-amd64 binary-i386", default "binary-amd64")':'define la[s] arquitectura[s], construidas en una sola ejecución (ej: "binary-amd64 binary-i386", "binary-amd64" por defecto)',
+'Serving the repository on http://%s:%d':'Sirviendo el repositorio en http://%s:%d',
+'removed':'eliminado',
+'%d added, %d upgraded, %d removed':'%d agregados, %d actualizados, %d eliminados',
+'Service error: %s':'Error del servicio: %s',
+'[host:]port':'[servidor:]puerto',
+'keep the indexes in memory and answer the requests of --server clients (ex: "8642")':'mantiene los índices en memoria y responde las peticiones de los clientes --server (ej: "8642")',
+'seconds':'segundos',
+'with --serve, seconds between checks of the origin Release files, 0 to disable them (default 300)':'con --serve, segundos entre comprobaciones de los ficheros Release de origen, 0 para desactivarlas (300 por defecto)',
+'url':'url',
+'send the requested actions to a running service (ex: "http://127.0.0.1:8642")':'envía las acciones pedidas a un servicio en ejecución (ej: "http://127.0.0.1:8642")',
+'%d packages found':'%d paquetes encontrados',
+'present':'presente',
+'not found':'no encontrado',
+'%d packages, %sB in total, %sB to download':'%d paquetes, %sB en total, %sB por descargar',
+'%s is not needed':'%s no es necesario',
+'term[s]':'término[s]',
+'package':'paquete',
+'search the origin packages by name, description, section or provided name (ex: "web server", "section:python", "provides:mail-transport-agent")':'busca los paquetes de origen por nombre, descripción, sección o nombre provisto (ej: "web server", "section:python", "provides:mail-transport-agent")',
+'show the packages adding packages would bring in and the size to download, without adding them':'muestra los paquetes que traería agregar paquetes y el tamaño a descargar, sin agregarlos',
+'show the dependency chain from the explicitly added packages (or the --query ones) to a package':'muestra la cadena de dependencias desde los paquetes agregados explícitamente (o los de --query) hasta un paquete',
+'with --search, --query and --why, use the origin indexes checked less than seconds ago without contacting the mirrors (default 3600)':'con --search, --query y --why, usa los índices de origen comprobados hace menos de los segundos indicados sin contactar las réplicas (3600 por defecto)',
+'No section matches %s':'Ninguna sección coincide con %s',
+'adds all packages from sections and all their dependencies to the custom repository, shell patterns are accepted (ex: "utils admin", "universe/python*")':'agrega todos los paquetes de las secciones y todas sus dependencias al repositorio personalizado, se aceptan patrones del shell (ej: "utils admin", "universe/python*")',
+'Warning: %s (%s) was not found, it is not recorded as an explicitly added package':'Aviso: %s (%s) no se encontró, no se registra como paquete agregado explícitamente',
+'Error: %s':'Error: %s',
+'The transaction was kept, run tinP again with --resume to continue it':'La transacción se conservó, ejecute tinP de nuevo con --resume para continuarla',
 }
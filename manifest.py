@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# manifest.py
+#
+# Copyright 2014 Carlos Cesar Caballero Diaz <ccesar@linuxmail.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+__author__ = 'cccaballero'
+
+import os
+import json
+from collections import deque
+from resolver import relation_names, REQUIRED_RELATIONS
+
+
+class RootsManifest(object):
+
+    def __init__(self, path):
+        """
+        Packages explicitly requested for a tinP repository, every other
+        package is only kept while a root needs it
+        :param path: json file of the manifest
+        """
+        self.path = path
+        self.roots = {}
+        self.exists = False
+        try:
+            with open(path) as f:
+                self.roots = json.load(f)['roots']
+            self.exists = True
+        except (IOError, ValueError, KeyError):
+            pass
+
+    def add(self, package_name, recommends=False, suggests=False):
+        """
+        Record a root package, with the kinds of optional relations it was added with
+        """
+        flags = self.roots.get(package_name, {})
+        self.roots[package_name] = {'recommends': recommends or flags.get('recommends', False),
+                                    'suggests': suggests or flags.get('suggests', False)}
+
+    def discard(self, package_name):
+        self.roots.pop(package_name, None)
+
+    def __contains__(self, package_name):
+        return package_name in self.roots
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        try:
+            os.makedirs(directory)
+        except OSError:
+            pass
+        with open(self.path + '.part', 'w') as f:
+            json.dump({'roots': self.roots}, f, indent=1, sort_keys=True)
+        os.rename(self.path + '.part', self.path)
+        self.exists = True
+
+
+def reachable(packages, roots):
+    """
+    Mark the packages needed by the roots of a repository. Every present
+    alternative of a dependency is kept and virtual names are followed to
+    all their providers, so nothing an installed system may use is lost
+    :param packages: dictionary of package name and package object, real packages only
+    :param roots: dictionary of root name and its flags (see RootsManifest)
+    :return: set of reachable package names
+    """
+    providers = {}
+    for name in packages:
+        for group in relation_names(packages[name], 'provides'):
+            for virtual in group:
+                providers.setdefault(virtual, []).append(name)
+
+    def resolve(names):
+        for name in names:
+            if name in packages:
+                yield name
+            for provider in providers.get(name, ()):
+                yield provider
+
+    marked = set()
+    queue = deque()
+    for root in roots:
+        kinds = [kind for kind in ('recommends', 'suggests') if roots[root].get(kind)]
+        heads = list(resolve([root]))
+        start = list(heads)
+        for name in heads:
+            for kind in kinds:
+                for group in relation_names(packages[name], kind):
+                    start.extend(resolve(group))
+        for name in start:
+            if name not in marked:
+                marked.add(name)
+                queue.append(name)
+    while queue:
+        package = packages[queue.popleft()]
+        for kind in REQUIRED_RELATIONS:
+            for group in relation_names(package, kind):
+                for name in resolve(group):
+                    if name not in marked:
+                        marked.add(name)
+                        queue.append(name)
+    return marked
@@ -19,49 +19,606 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
 # MA 02110-1301, USA.
-import gzip
+import os
+import re
+import bz2
+import binascii
+import zlib
+import mmap
+import threading
 
 __author__ = 'cccaballero'
 
-from debian import deb822
 from contrib.unwrapt.utils import url_join, to_url
-from contrib.unwrapt.Download import download
-import tempfile
+from store import PackageStore, STORED_RELATIONS, _NO_SHA256
+from version import version_key
+import stats
+try:
+    import lzma
+except ImportError:
+    lzma = None
 
-def get_packages(repositories, arch='binary-i386', packages_index_filename='Packages.gz'):
+
+def _deb822():
+    # python-debian is slow to import and only PackageStanza and the
+    # "deb822" parser need it
+    from debian import deb822
+    return deb822
+
+
+RELATION_FIELDS = ('Depends', 'Pre-Depends', 'Recommends', 'Suggests', 'Breaks',
+                   'Conflicts', 'Provides', 'Replaces', 'Enhances', 'Built-Using')
+
+
+class PackageStanza(dict):
+    """
+    Lightweight package stanza, a plain dictionary of fields offering the
+    deb822.Packages interface used by tinP (relations, base_url and dump)
+    """
+
+    base_url = None
+
+    @classmethod
+    def from_text(cls, text):
+        """
+        Parse a single stanza text
+        """
+        return cls(_deb822().Packages(text))
+
+    @property
+    def relations(self):
+        """
+        Dictionary of parsed relations, parsed on first use
+        """
+        try:
+            return self._relations
+        except AttributeError:
+            parse_relations = _deb822().PkgRelation.parse_relations
+            self._relations = dict((field.lower(), parse_relations(self[field])
+                                    if field in self else [])
+                                   for field in RELATION_FIELDS)
+            return self._relations
+
+    def dump(self, fd=None, encoding='utf-8', text_mode=False):
+        """
+        Dump the stanza in the Packages file format
+        :param fd: file object to write to, the stanza text is returned if None
+        :param text_mode: fd is a text file
+        """
+        lines = []
+        for key, value in self.items():
+            if not value or value[0] == '\n':
+                lines.append('%s:%s\n' % (key, value))
+            else:
+                lines.append('%s: %s\n' % (key, value))
+        text = ''.join(lines)
+        if fd is None:
+            return text
+        fd.write(text if text_mode else text.encode(encoding))
+
+
+def iter_stanza_spans(data):
+    """
+    Split a packages index in stanzas
+    :param data: uncompressed index bytes (bytes or mmap)
+    :return: iterator of (start, end) byte offsets of every stanza
+    """
+    position = 0
+    length = len(data)
+    while position < length:
+        # skip the blank lines between stanzas
+        while position < length and data[position:position + 1] == b'\n':
+            position += 1
+        if position >= length:
+            break
+        end = data.find(b'\n\n', position)
+        end = length if end < 0 else end + 1
+        yield position, end
+        position = end
+
+
+# fields read from every stanza by the fast parser, the rest stay in the stanza text
+FAST_FIELDS = ('Package', 'Version', 'Filename', 'Section', 'Size', 'SHA256',
+               'Depends', 'Pre-Depends', 'Recommends', 'Suggests', 'Provides')
+_FIELD_NAMES = dict((field.lower().encode('ascii'), field) for field in FAST_FIELDS)
+_FIELD_NAMES.update((field.encode('ascii'), field) for field in FAST_FIELDS)
+_RELATION_KINDS = dict((field, field.lower()) for field in FAST_FIELDS if field.lower() in STORED_RELATIONS)
+_FIELD_RE = re.compile(br'^(' + b'|'.join(re.escape(field.encode('ascii')) for field in FAST_FIELDS) +
+                       br'):[ \t]*(.*(?:\n[ \t].*)*)', re.M | re.I)
+_RELATION_NAME_RE = re.compile(r'\s*([a-zA-Z0-9][a-zA-Z0-9+._-]*)')
+
+
+def parse_relation_names(relation):
+    """
+    Parse a relation field keeping only package names
+    :param relation: relation string (ex: "libc6 (>= 2.4), debconf | debconf-2.0")
+    :return: list of alternative groups, each one a list of package names
+    """
+    groups = []
+    for group in relation.strip().split(','):
+        names = []
+        for alternative in group.split('|'):
+            match = _RELATION_NAME_RE.match(alternative)
+            names.append(match.group(1) if match else alternative.strip())
+        groups.append(names)
+    return groups
+
+
+def scan_stanza(data, start, end):
+    """
+    Extract the fields tinP needs from a stanza without a full deb822 parse
+    :param data: uncompressed index bytes (bytes or mmap)
+    :param start: stanza start offset
+    :param end: stanza end offset
+    :return: (fields dictionary, relations dictionary) tuple
+    """
+    fields = {}
+    relations = {}
+    for name, value in _FIELD_RE.findall(data, start, end):
+        field = _FIELD_NAMES.get(name) or _FIELD_NAMES[name.lower()]
+        if field in fields:
+            continue
+        value = fields[field] = value.strip().decode('utf-8')
+        kind = _RELATION_KINDS.get(field)
+        if kind:
+            relations[kind] = parse_relation_names(value)
+    return fields, relations
+
+
+def _append_stanza(store, data, start, end, parser):
+    if parser == 'fast':
+        fields, relations = scan_stanza(data, start, end)
+    else:
+        fields = _deb822().Packages(bytes(data[start:end]).decode('utf-8'))
+        relations = dict((kind, [[dep['name'] for dep in group] for group in fields.relations[kind]])
+                         for kind in STORED_RELATIONS)
+    store.append_span(fields, start, end - start, relations)
+
+
+def parse_packages_data(data, base_url=None, parser='fast'):
+    """
+    Build a package store from an uncompressed packages index, the data is
+    used as the store stanzas blob so stanzas are kept verbatim
+    :param data: uncompressed index bytes (bytes or mmap)
+    :param base_url: url of the repository the index belongs to
+    :param parser: "fast" to scan only the needed fields, "deb822" to parse
+        every stanza with python-debian
+    :return: PackageStore
+    """
+    store = PackageStore(base_url)
+    store.stanzas = data
+    with stats.timer('index.parse'):
+        for start, end in iter_stanza_spans(data):
+            _append_stanza(store, data, start, end, parser)
+    stats.count('index.stanzas', len(store))
+    return store
+
+
+class _GzipDecompressor(object):
+    """
+        Incremental gzip decompressor, concatenated members are supported
+    """
+
+    def __init__(self):
+        self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def decompress(self, data):
+        blocks = []
+        while data:
+            blocks.append(self.decompressor.decompress(data))
+            data = self.decompressor.unused_data
+            if data:
+                self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        return b''.join(blocks)
+
+    def flush(self):
+        return self.decompressor.flush()
+
+
+class _Decompressor(object):
+    """
+        Uniform interface for the bz2 and lzma incremental decompressors,
+        and for uncompressed indexes when created without one
+    """
+
+    def __init__(self, decompressor=None):
+        self.decompressor = decompressor
+
+    def decompress(self, data):
+        if self.decompressor is None:
+            return data
+        return self.decompressor.decompress(data)
+
+    def flush(self):
+        return b''
+
+
+def get_decompressor(packages_index_filename):
+    """
+    Return an incremental decompressor for a packages index
+    :param packages_index_filename: index name, used to detect compression
+    :return: object with decompress(data) and flush() methods
+    """
+    extension = packages_index_filename.rsplit('.', 1)[-1]
+    if extension == 'gz':
+        return _GzipDecompressor()
+    if extension == 'bz2':
+        return _Decompressor(bz2.BZ2Decompressor())
+    if extension == 'xz':
+        if lzma is None:
+            raise InvalidRepository("xz indexes need the lzma module: %s" % packages_index_filename)
+        return _Decompressor(lzma.LZMADecompressor())
+    return _Decompressor()
+
+
+# index variants in order of preference when the Release file lists no sizes
+INDEX_COMPRESSIONS = ('.xz', '.bz2', '.gz', '') if lzma is not None else ('.bz2', '.gz', '')
+
+
+def choose_packages_index(release_files, section_name, arch, default='Packages.gz'):
+    """
+    Return the smallest packages index variant listed in a Release file
+    :param release_files: dictionary returned by parse_release
+    :param section_name: repository section (main, contrib, ...)
+    :param arch: architecture directory (binary-amd64, ...)
+    :param default: index name used when the Release file lists none
+    :return: index file name (Packages.xz, Packages.gz, ...)
+    """
+    candidates = []
+    for preference, extension in enumerate(INDEX_COMPRESSIONS):
+        name = 'Packages' + extension
+        listed = release_files.get(url_join(section_name, arch, name))
+        if listed is not None:
+            candidates.append((listed[1], preference, name))
+    if not candidates:
+        return default
+    return min(candidates)[2]
+
+
+class IndexStream(object):
+
+    def __init__(self, packages_index_filename='Packages.gz', base_url=None, parser='fast'):
+        """
+        Incremental packages index parser. Compressed blocks are fed as they
+        arrive, decompressed and every complete stanza is parsed right away,
+        so reading, decompressing and parsing overlap and no temporary file
+        is needed
+        :param packages_index_filename: index name, used to detect compression
+        :param base_url: url of the repository the index belongs to
+        :param parser: "fast" or "deb822", see parse_packages_data
+        """
+        self.decompressor = get_decompressor(packages_index_filename)
+        self.parser = parser
+        self.store = PackageStore(base_url)
+        self.data = self.store.stanzas = bytearray()
+        self.position = 0
+
+    def _scan(self, final=False):
+        data = self.data
+        position = self.position
+        length = len(data)
+        while position < length:
+            # skip the blank lines between stanzas
+            while position < length and data[position:position + 1] == b'\n':
+                position += 1
+            if position >= length:
+                break
+            end = data.find(b'\n\n', position)
+            if end < 0:
+                if not final:
+                    break
+                end = length
+            else:
+                end += 1
+            _append_stanza(self.store, data, position, end, self.parser)
+            position = end
+        self.position = position
+
+    def feed(self, data):
+        """
+        Add a block of the (compressed) index
+        """
+        with stats.timer('index.decompress'):
+            data = self.decompressor.decompress(data)
+        self.data.extend(data)
+        with stats.timer('index.parse'):
+            self._scan()
+
+    def close(self):
+        """
+        Parse the last stanza
+        :return: PackageStore
+        """
+        self.data.extend(self.decompressor.flush())
+        with stats.timer('index.parse'):
+            self._scan(final=True)
+        stats.count('index.stanzas', len(self.store))
+        return self.store
+
+
+def _map_file(path):
+    index_file = open(path, 'rb')
+    try:
+        if not os.fstat(index_file.fileno()).st_size:
+            return b''
+        return mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+        index_file.close()
+
+
+def read_packages_index(index_path, packages_index_filename='Packages.gz', base_url=None, parser='fast'):
+    """
+    Parse a downloaded packages index file
+    :param index_path: path to the packages index
+    :param packages_index_filename: index name, used to detect compression
+    :param base_url: url of the repository the index belongs to
+    :param parser: "fast" or "deb822", see parse_packages_data
+    :return: PackageStore
+    """
+    if '.' not in packages_index_filename:
+        return parse_packages_data(_map_file(index_path), base_url, parser)
+    stream = IndexStream(packages_index_filename, base_url, parser)
+    index_file = open(index_path, 'rb')
+    try:
+        for block in iter(lambda: index_file.read(1024 * 1024), b''):
+            stream.feed(block)
+    finally:
+        index_file.close()
+    return stream.close()
+
+
+def read_packages_file(index_path, base_url=None, parser='fast'):
+    """
+    Parse an uncompressed packages index keeping every stanza offset, the
+    file is memory mapped and used as the store stanzas blob, so untouched
+    stanzas can be copied verbatim
+    :param index_path: path to the uncompressed packages index
+    :param base_url: url of the repository the index belongs to
+    :return: PackageStore
+    """
+    return parse_packages_data(_map_file(index_path), base_url, parser)
+
+
+class ParsePool(object):
+    """
+        Process pool for parsing big indexes out of the main process. The
+        workers are started on the first big index only, by a fork server
+        (or spawned), never forked from the calling process, which may be
+        running other threads
+    """
+
+    min_size = 1024 * 1024
+
+    def __init__(self, processes=None):
+        self.processes = processes
+        self.pool = None
+        self.lock = threading.Lock()
+
+    def _get_pool(self):
+        with self.lock:
+            if self.pool is None:
+                import multiprocessing
+
+                context = multiprocessing
+                if hasattr(multiprocessing, 'get_context'):
+                    # a child forked while another thread holds a lock (stats,
+                    # the index cache, logging) may deadlock on it
+                    methods = multiprocessing.get_all_start_methods()
+                    context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+                self.pool = context.Pool(self.processes)
+            return self.pool
+
+    def parse(self, index_path, packages_index_filename='Packages.gz', base_url=None):
+        if os.path.getsize(index_path) < self.min_size:
+            return read_packages_index(index_path, packages_index_filename, base_url)
+        # the stats of the worker process never reach this one, the call is
+        # timed here (decompression included) and the stanzas counted here
+        with stats.timer('index.parse'):
+            store = self._get_pool().apply(read_packages_index, (index_path, packages_index_filename, base_url))
+        stats.count('index.stanzas', len(store))
+        return store
+
+    def close(self):
+        with self.lock:
+            pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+
+def parse_release(text):
+    """
+    Return the files listed in the SHA256 section of a Release (or InRelease) file
+    :param text: Release file contents
+    :return: dictionary of file name and (SHA256, size) tuple
+    """
+    files = {}
+    in_sha256 = False
+    for line in text.splitlines():
+        if line.startswith('-----BEGIN PGP SIGNATURE'):
+            break
+        if not line.startswith(' '):
+            in_sha256 = line.strip() == 'SHA256:'
+        elif in_sha256:
+            fields = line.split()
+            if len(fields) == 3:
+                files[fields[2]] = (fields[0], int(fields[1]))
+    return files
+
+
+def get_release_files(release_url):
+    """
+    Download a Release file (or its InRelease variant) and return its files
+    :param release_url: Release file url
+    :return: dictionary returned by parse_release, empty if there is no Release
+    """
+    from contrib.unwrapt.Download import download_stream
+
+    for url in (release_url, release_url[:-len('Release')] + 'InRelease'):
+        blocks = []
+        try:
+            download_stream(url, blocks.append, progress=None, recorder=stats)
+        except (IOError, OSError):
+            continue
+        return parse_release(b''.join(blocks).decode('utf-8', 'replace'))
+    return {}
+
+
+def get_section_index(section, arch='binary-i386', packages_index_filename='Packages.gz', cache=None):
+    """
+    Return the url and name of the packages index of a section, the
+    smallest variant listed in the Release file is chosen
+    :param section: repository section (see create_section)
+    :param packages_index_filename: index name used when the Release file lists none
+    :param cache: IndexCache, its Release files are fetched once per run
+    :return: (url, index name) tuple
+    """
+    release_url = url_join(section["surl"], "dists", section["dist"], "Release")
+    if cache is not None:
+        release_files = cache.release_files(release_url)
+    else:
+        release_files = get_release_files(release_url)
+    packages_index_filename = choose_packages_index(release_files, section["section"], arch,
+                                                    packages_index_filename)
+    return to_url(section, arch, packages_index_filename), packages_index_filename
+
+
+def get_section_packages(section, arch='binary-i386', packages_index_filename='Packages.gz', cache=None,
+                         parse_pool=None):
+    """
+    Return the packages of a single repository section. Downloaded indexes
+    are decompressed and parsed while they arrive
+    :param section: repository section (see create_section)
+    :param cache: IndexCache used to skip downloading and parsing unchanged indexes
+    :param parse_pool: optional ParsePool for parsing big indexes
+    :return: PackageStore
+    """
+    package_sources_path, packages_index_filename = get_section_index(section, arch, packages_index_filename,
+                                                                      cache)
+    if parse_pool is not None:
+        parse = lambda index_path: parse_pool.parse(index_path, packages_index_filename, section["surl"])
+    else:
+        parse = lambda index_path: read_packages_index(index_path, packages_index_filename, section["surl"])
+    stream = lambda: IndexStream(packages_index_filename, section["surl"])
+    if cache is not None:
+        release = (url_join(section["surl"], "dists", section["dist"], "Release"),
+                   url_join(section["section"], arch, packages_index_filename))
+        store = cache.get(package_sources_path, parse, release, stream=stream,
+                          load=PackageStore.load, save=lambda store, path: store.save(path))
+    else:
+        from contrib.unwrapt.Download import download_stream
+
+        index_stream = stream()
+        download_stream(package_sources_path, index_stream.feed, recorder=stats)
+        store = index_stream.close()
+    store.base_url = section["surl"]
+    return store
+
+
+def get_packages(repositories, arch='binary-i386', packages_index_filename='Packages.gz', cache=None, workers=4,
+                 mirrors=None, parse_pool=None):
     """
     Return packages information from a repository package file
-    :param packages_file: debian repository packages file
-    :return: packages dictionary
+    :param repositories: repository sections
+    :param cache: optional IndexCache for the packages indexes
+    :param workers: number of sections fetched and parsed at the same time,
+        big indexes are parsed in a process pool
+    :param mirrors: optional dictionary filled with the base urls of every
+        file found in more than one repository, see get_mirrors
+    :param parse_pool: optional ParsePool shared with other loads running
+        at the same time, a private one is used by default
+    :return: packages dictionary of PackageRecord objects
     """
+    with stats.timer('index.load'):
+        return _get_packages(list(repositories), arch, packages_index_filename, cache, workers, mirrors,
+                             parse_pool)
+
+
+def _get_packages(repositories, arch, packages_index_filename, cache, workers, mirrors=None, parse_pool=None):
+    if workers > 1 and len(repositories) > 1:
+        from multiprocessing.pool import ThreadPool
+
+        private_pool = parse_pool is None
+        if private_pool:
+            parse_pool = ParsePool()
+        pool = ThreadPool(min(workers, len(repositories)))
+        try:
+            stores = pool.map(lambda section: get_section_packages(section, arch, packages_index_filename,
+                                                                   cache, parse_pool), repositories)
+        finally:
+            pool.close()
+            pool.join()
+            if private_pool:
+                parse_pool.close()
+    else:
+        stores = [get_section_packages(section, arch, packages_index_filename, cache, parse_pool)
+                  for section in repositories]
+    if mirrors is not None:
+        mirrors.update(_find_mirrors(stores))
+
+    # merge in sources order, so the result does not depend on which section finished first
     packages = {}
-    # packages = []
-    for section in repositories:
-        package_sources_path = to_url(section, arch, packages_index_filename)
-        tmp_file = tempfile.mkdtemp()
-        download(package_sources_path, tmp_file+"/tmp000")
-        # packages.append(deb822.Packages.iter_paragraphs(open(tmp_file+"/tmp000")))
-        if packages_index_filename.split('.')[-1] == 'gz':
-            tmp_package_file = gzip.open(tmp_file + "/tmp000")
-        else:
-            tmp_package_file = open(tmp_file + "/tmp000")
-        for pkg in deb822.Packages.iter_paragraphs(tmp_package_file):
-            pkg.base_url = section["surl"]
-            if pkg['Package'] in packages:
-                if pkg['Version'] > packages[pkg['Package']]['Version']:
-                    packages[pkg['Package']] = pkg
-                    # virtual packages (basic support)
-                    for provides in pkg.relations['provides']:
-                        for virtual in provides:
-                            packages[virtual['name']] = pkg
-            else:
-                packages[pkg['Package']] = pkg
-                # virtual packages (basic support)
-                for provides in pkg.relations['provides']:
-                    for virtual in provides:
-                        packages[virtual['name']] = pkg
+    newest = {}
+    for store in stores:
+        for index in range(len(store)):
+            name = store.package_name(index)
+            key = version_key(store.package_version(index))
+            if name in newest and not key > newest[name]:
+                continue
+            pkg = store.record(index)
+            packages[name] = pkg
+            newest[name] = key
+            # virtual packages (basic support), real packages keep their name
+            for provides in store.relation(index, 'provides'):
+                for virtual in provides:
+                    if virtual not in newest:
+                        packages[virtual] = pkg
     return packages
 
+
+def _find_mirrors(stores):
+    """
+    Find the files published by several repositories, a file is the same
+    when both its Filename and its SHA256 match
+    :return: dictionary of (Filename, SHA256 digest) and list of base urls
+    """
+    if len(set(store.base_url for store in stores)) < 2:
+        return {}
+    found = {}
+    for store in stores:
+        strings = store.strings
+        for index in range(len(store)):
+            if store.filename[index] < 0:
+                continue
+            digest = bytes(store.sha256[index * 32:index * 32 + 32])
+            if digest == _NO_SHA256:
+                continue
+            base_urls = found.setdefault((strings[store.filename[index]], digest), [])
+            if store.base_url not in base_urls:
+                base_urls.append(store.base_url)
+    return dict((key, base_urls) for key, base_urls in found.items() if len(base_urls) > 1)
+
+
+def get_mirrors(packages, mirrors):
+    """
+    Return the other repositories carrying the files of a group of packages
+    :param packages: iterable of package objects
+    :param mirrors: dictionary filled by get_packages
+    :return: dictionary of package Filename and list of alternative base urls
+    """
+    alternatives = {}
+    if not mirrors:
+        return alternatives
+    for package in packages:
+        if 'SHA256' not in package or 'Filename' not in package:
+            continue
+        base_urls = mirrors.get((package['Filename'], binascii.unhexlify(package['SHA256'])), ())
+        others = [base_url for base_url in base_urls if base_url != package.base_url]
+        if others:
+            alternatives[package['Filename']] = others
+    return alternatives
+
+
 class InvalidRepository(Exception):
     """
         A repository string was passed that is invalid or not supported
@@ -116,7 +673,7 @@ def parse_relation(relation):
     :param relation: relation string
     :return: list of package names in relations
     """
-    relation_object = deb822.PkgRelation()
+    relation_object = _deb822().PkgRelation()
     relations = []
     for recommends_list in relation_object.parse_relations(relation):
         for dep in recommends_list:
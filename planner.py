@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# planner.py
+#
+# Copyright 2014 Carlos Cesar Caballero Diaz <ccesar@linuxmail.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+__author__ = 'cccaballero'
+
+import os
+from version import version_key
+from verify import is_present
+
+
+def version_map(packages):
+    """
+    Return the name and version key of the real packages of a packages
+    dictionary, virtual names are left out
+    :param packages: dictionary of package name and package object
+    :return: dictionary of package name and version key
+    """
+    versions = {}
+    for name in packages:
+        package = packages[name]
+        if package['Package'] == name:
+            versions[name] = version_key(package['Version'])
+    return versions
+
+
+def is_fetched(tinp, package):
+    """
+    Tell whether the file of a package needs no download, it is already
+    in the tinP repository or in its pool
+    :param tinp: TinpRepository
+    :param package: package object
+    """
+    if is_present(os.path.join(tinp.path, package['Filename']), int(package.get('Size', 0))):
+        return True
+    sha256 = package.get('SHA256')
+    return tinp.pool is not None and bool(sha256) and sha256 in tinp.pool
+
+
+class UpgradePlan(object):
+
+    def __init__(self, new, changed, removed):
+        """
+        Packages an upgrade has to add to a tinP repository
+        :param new: package objects newly required by the upgraded packages
+        :param changed: list of (current package, new package) tuples
+        :param removed: names of packages no longer in the source repositories
+        """
+        self.new = new
+        self.changed = changed
+        self.removed = removed
+
+    def packages(self):
+        """
+        Return the package objects to add to the repository
+        """
+        return [new for old, new in self.changed] + self.new
+
+    def transfer_size(self, tinp):
+        """
+        Return the bytes to download to carry out the plan, files already
+        in the repository or in its pool are not counted
+        :param tinp: TinpRepository the plan is for
+        """
+        size = 0
+        for package in self.packages():
+            if not is_fetched(tinp, package):
+                size += int(package.get('Size', 0))
+        return size
+
+    def summary(self, tinp):
+        """
+        Return the plan as plain data, for printing or sending as json
+        :param tinp: TinpRepository the plan is for
+        :return: dictionary with "upgraded" ([name, old version, new version]
+            lists), "added" ([name, version] lists), "not_found" (names) and
+            "download_size" (see transfer_size)
+        """
+        return {'upgraded': [[new['Package'], old['Version'], new['Version']] for old, new in self.changed],
+                'added': [[package['Package'], package['Version']] for package in self.new],
+                'not_found': list(self.removed),
+                'download_size': self.transfer_size(tinp)}
+
+    def __len__(self):
+        return len(self.new) + len(self.changed)
+
+
+def plan_upgrade(tinp, source):
+    """
+    Diff a tinP repository against the source repositories. Both sides are
+    reduced to name and version key maps and compared in one pass, then
+    the dependencies of the upgraded packages missing from the repository
+    are added as new packages
+    :param tinp: TinpRepository to upgrade
+    :param source: SourceRepository with its packages loaded
+    :return: UpgradePlan
+    """
+    current = version_map(tinp.packages)
+    available = version_map(source.packages)
+    changed = []
+    removed = []
+    for name in sorted(current):
+        version = available.get(name)
+        if version is None:
+            removed.append(name)
+        elif version > current[name]:
+            changed.append((tinp.packages[name], source.packages[name]))
+    new = []
+    if changed:
+        tree = source.get_packages_tree([package['Package'] for old, package in changed])
+        seen = set()
+        for name in sorted(tree):
+            package = tree[name]
+            package_name = package['Package']
+            if package_name in current or package_name in seen:
+                continue
+            seen.add(package_name)
+            new.append(package)
+    return UpgradePlan(new, changed, removed)
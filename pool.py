@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# pool.py
+#
+# Copyright 2014 Carlos Cesar Caballero Diaz <ccesar@linuxmail.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+__author__ = 'cccaballero'
+
+import os
+import hashlib
+from shutil import copy2
+
+# Linux ioctl cloning a file on copy-on-write filesystems (btrfs, xfs)
+FICLONE = 0x40049409
+# ways link_file shares a file
+HARDLINK, REFLINK, COPY = 'hardlink', 'reflink', 'copy'
+# suffix of the marker of pooled files shared without a hardlink
+UNLINKED_SUFFIX = '.unlinked'
+
+
+def file_sha256(path):
+    """
+    Return the SHA256 of a file
+    """
+    digest = hashlib.sha256()
+    f = open(path, 'rb')
+    try:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    finally:
+        f.close()
+    return digest.hexdigest()
+
+
+def _reflink(source, destination):
+    import fcntl
+    source_file = open(source, 'rb')
+    try:
+        destination_file = open(destination, 'wb')
+        try:
+            fcntl.ioctl(destination_file.fileno(), FICLONE, source_file.fileno())
+        finally:
+            destination_file.close()
+    finally:
+        source_file.close()
+
+
+def link_file(source, destination):
+    """
+    Make destination share the contents of source: a hardlink, a reflink
+    if they are in different filesystems, or a copy as last resort
+    :return: HARDLINK, REFLINK or COPY
+    """
+    if os.path.lexists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+        return HARDLINK
+    except (OSError, AttributeError):
+        pass
+    try:
+        _reflink(source, destination)
+        return REFLINK
+    except (IOError, OSError, ImportError):
+        if os.path.exists(destination):
+            os.remove(destination)
+    copy2(source, destination)
+    return COPY
+
+
+class PackagePool(object):
+
+    def __init__(self, path):
+        """
+        Content addressed store of package files shared by several tinP
+        repositories, files are named after their SHA256 and linked into
+        the repositories
+        :param path: pool directory
+        """
+        self.path = path
+
+    def path_for(self, sha256):
+        return os.path.join(self.path, sha256[:2], sha256[2:4], sha256)
+
+    def __contains__(self, sha256):
+        return os.path.exists(self.path_for(sha256))
+
+    def _shared(self, sha256, method):
+        """
+        Record how a pooled file was shared, the link count of a file ever
+        reflinked or copied does not tell whether a repository still uses it
+        """
+        if method != HARDLINK:
+            open(self.path_for(sha256) + UNLINKED_SUFFIX, 'a').close()
+
+    def link_to(self, sha256, destination):
+        """
+        Link a pooled file into a repository
+        :return: True if the file was in the pool
+        """
+        source = self.path_for(sha256)
+        if not os.path.exists(source):
+            return False
+        self._shared(sha256, link_file(source, destination))
+        return True
+
+    def add(self, sha256, source):
+        """
+        Add a downloaded file to the pool, files not matching their hash are
+        not added
+        :return: True if the file is in the pool
+        """
+        target = self.path_for(sha256)
+        if os.path.exists(target):
+            return True
+        if file_sha256(source) != sha256:
+            return False
+        try:
+            os.makedirs(os.path.dirname(target))
+        except OSError:
+            pass
+        tmp_target = '%s.%d.part' % (target, os.getpid())
+        method = link_file(source, tmp_target)
+        os.rename(tmp_target, target)
+        self._shared(sha256, method)
+        return True
+
+    def prune(self):
+        """
+        Remove pooled files no repository links to anymore. Only files
+        always shared through hardlinks are removed, files ever reflinked
+        or copied into a repository are kept
+        :return: number of removed files
+        """
+        removed = 0
+        for directory, subdirectories, filenames in os.walk(self.path):
+            names = set(filenames)
+            for filename in filenames:
+                # markers and files being added are not pooled files
+                if '.' in filename or filename + UNLINKED_SUFFIX in names:
+                    continue
+                path = os.path.join(directory, filename)
+                if os.stat(path).st_nlink == 1:
+                    os.remove(path)
+                    removed += 1
+        return removed
@@ -23,12 +23,28 @@
 __author__ = 'cccaballero'
 
 import os
-from contrib.unwrapt import Download
 from contrib.unwrapt.utils import to_url
-from parsers import get_packages, create_section
+from parsers import get_packages, get_mirrors, create_section, read_packages_file, ParsePool
+from resolver import DependencyResolver, relation_names
+from index import get_package_index
+from manifest import RootsManifest, reachable
+from journal import Journal
+from store import PackageRecord
+from version import is_newer
+from verify import HashCache, is_present
+from writer import IndexWriter, write_release, read_release, BUFFER_SIZE
+import stats
 from io import open
 
 
+class DownloadError(IOError):
+    """
+        Files of a transaction could not be downloaded, the transaction
+        journal is kept so the transaction can be resumed
+    """
+    pass
+
+
 class Repository:
 
     def __init__(self, packages = [], arch='binary-i386'):
@@ -49,149 +65,617 @@ class Repository:
 
 class TinpRepository(Repository):
 
-    def __init__(self, path, packages={}, arch='binary-amd64'):
+    def __init__(self, path, packages={}, arch='binary-amd64', pool=None, verify=False, scheduler=None):
         """
         Creates a new tinP repository instance
         :param packages: Dictionary of package objects following a deb822 instance
         :param path: Path of the tinP repository
         :param arch: repository architecture
+        :param pool: optional PackagePool shared with other tinP repositories
+        :param verify: check the SHA256 of files already present, not only their size
+        :param scheduler: optional DownloadScheduler (mirrors, per host limits,
+            retries, bandwidth cap), a plain one is used by default
         """
-        Repository.__init__(self, packages, arch)
+        # copied, instances of several architectures must not share the default dictionary
+        Repository.__init__(self, dict(packages), arch)
         self.path = path
+        self.pool = pool
+        self.scheduler = scheduler
+        self.meta_dir = os.path.join(self.path, '.tinp')
+        self.hash_cache = HashCache(os.path.join(self.meta_dir, 'hashes.json')) if verify else None
+        self.journal = Journal(os.path.join(self.meta_dir, 'transaction-%s' % arch))
+        self.obsolete = []
+        self.index_files = None
+        self.unresolved_roots = []
         self.repository = 'deb file:%s tinp main' % self.path.replace(' ','%20')
         self.repository = create_section(self.repository)
         self.packages_index_path = to_url(self.repository[0], self.arch, 'Packages').replace('%20',' ')
         if self.packages_index_path.startswith('file:'):
             self.packages_index_path = self.packages_index_path.replace('file:', '', 1)
+        self.packages_index_dir, self.packages_index_filename = os.path.split(self.packages_index_path)
+        self.component_dir, self.arch_dir = os.path.split(self.packages_index_dir)
+        release_dir, self.component = os.path.split(self.component_dir)
+        self.release_path = os.path.join(release_dir, 'Release')
         self.load_packages()
+        self.manifest = None
+        self.get_manifest()
         # self.packages_index_path = os.path.join(self.path, 'dists', 'tinp', 'main', self.arch, 'Packages')
 
     def load_packages(self):
         """
-        load packages from package index
+        load packages from package index, the index is kept mapped so the
+        stanzas of untouched packages are reused when it is rebuilt
         """
+        self.index_store = None
+        self.changed = False
         try:
-            self.packages = get_packages(self.repository, arch=self.arch)
-        except:
-            pass
+            self.index_store = read_packages_file(self.packages_index_path, self.repository[0]["surl"])
+        except (IOError, OSError):
+            try:
+                self.packages = get_packages(self.repository, arch=self.arch)
+            except:
+                pass
+            return
+        self.packages = {}
+        for index in range(len(self.index_store)):
+            self.packages[self.index_store.package_name(index)] = self.index_store.record(index)
+
+    def get_manifest(self):
+        """
+        Return the manifest of root packages of the architecture. Roots of
+        the single manifest of older repositories are taken over, and
+        repositories created before any manifest existed get every current
+        package as root, so nothing is collected until roots are removed
+        """
+        if self.manifest is None:
+            self.manifest = RootsManifest(os.path.join(self.meta_dir, 'roots-%s.json' % self.arch))
+            if not self.manifest.exists:
+                legacy = RootsManifest(os.path.join(self.meta_dir, 'roots.json'))
+                if legacy.exists:
+                    self.manifest.roots = dict(legacy.roots)
+                else:
+                    for package_name in self.packages:
+                        self.manifest.add(package_name)
+        return self.manifest
+
+    def add_roots(self, package_names, recommends=False, suggests=False, packages=None):
+        """
+        Record explicitly requested packages in the manifest. A virtual
+        name is recorded as the packages providing it, taken from the added
+        packages (the ones the resolver chose) or else from the repository
+        :param packages: optional package objects of the transaction adding the roots
+        :return: names neither in the repository nor provided by one of its packages
+        """
+        manifest = self.get_manifest()
+        unresolved = []
+        providers = None
+        for package_name in package_names:
+            if package_name in self.packages:
+                manifest.add(self.packages[package_name]['Package'], recommends, suggests)
+                continue
+            if providers is None:
+                providers = (_providers(packages or (), self.packages),
+                             _providers(self.packages.values(), self.packages))
+            names = providers[0].get(package_name) or providers[1].get(package_name)
+            if not names:
+                unresolved.append(package_name)
+            for name in names or ():
+                manifest.add(name, recommends, suggests)
+        manifest.save()
+        return unresolved
+
+    def collect_garbage(self):
+        """
+        Remove the packages no root package needs, in one batch. The index
+        must be rebuilt afterwards
+        :return: names of the removed packages
+        """
+        manifest = self.get_manifest()
+        marked = reachable(self.packages, manifest.roots)
+        orphans = [package_name for package_name in self.packages if package_name not in marked]
+        for package_name in orphans:
+            self.remove_package(package_name)
+        for package_name in list(manifest.roots):
+            if package_name not in self.packages:
+                manifest.discard(package_name)
+        manifest.save()
+        return orphans
 
     def remove_package(self, package_name):
         """
-        Remove a package from repository
+        Remove a package from repository, its dependencies are removed by
+        collect_garbage. The file is deleted once the rebuilt index no
+        longer lists it
         :param package_name: Name of package to remove
-        TODO: remove unused dependencies
         """
-        package_path = os.path.join(self.path, self.packages[package_name]['Filename'])
+        self.obsolete.append(os.path.join(self.path, self.packages[package_name]['Filename']))
+        del self.packages[package_name]
+        self.changed = True
+
+    def _files_in_use(self):
+        """
+        Return the paths of the files of the current packages and of the
+        packages of the other architectures (arch: all files are shared)
+        """
+        used = set(os.path.join(self.path, self.packages[package_name]['Filename'])
+                   for package_name in self.packages)
         try:
-            os.remove(package_path)
-            path_directory, filename = os.path.split(package_path)
-            os.removedirs(path_directory)
-        except IOError:
-            pass
+            arch_dirs = os.listdir(self.component_dir)
         except OSError:
+            arch_dirs = []
+        for arch_dir in arch_dirs:
+            if arch_dir == self.arch_dir:
+                continue
+            try:
+                store = read_packages_file(os.path.join(self.component_dir, arch_dir, self.packages_index_filename))
+            except (IOError, OSError, ValueError):
+                continue
+            used.update(os.path.join(self.path, store.strings[filename]) for filename in store.filename
+                        if filename >= 0)
+        return used
+
+    def _delete_obsolete(self):
+        """
+        Delete the files of removed packages, unless a current package (of
+        any architecture) uses the same file
+        """
+        if not self.obsolete:
+            return
+        current = self._files_in_use()
+        for package_path in self.obsolete:
+            if package_path in current:
+                continue
+            try:
+                os.remove(package_path)
+                path_directory, filename = os.path.split(package_path)
+                os.removedirs(path_directory)
+            except IOError:
+                pass
+            except OSError:
+                pass
+        self.obsolete = []
+
+    def _stage_package(self, package):
+        """
+        Register a package in the repository index
+        :param package: Package object
+        :return: (package url, package path) tuple if the package file must be downloaded, None otherwise
+        """
+        new_package_name = package['Package']
+        if new_package_name in self.packages:
+            if not is_newer(package['Version'], self.packages[new_package_name]['Version']):
+                return None
+            self.remove_package(new_package_name)
+        self.packages[new_package_name] = package
+        self.changed = True
+        package_file = os.path.join(package.base_url, package['Filename'])
+        package_path = os.path.join(self.path, package['Filename'])
+        package_dir, package_filename = os.path.split(package_path)
+        try:
+            os.makedirs(package_dir)
+        except:
             pass
-        del self.packages[package_name]
+        return package_file, package_path
+
+    def _stage_packages(self, packages):
+        files = []
+        for package in packages:
+            staged = self._stage_package(package)
+            if staged:
+                files.append((package,) + staged)
+        return files
+
+    def _missing_files(self, staged):
+        """
+        Select the staged files to download. Files already present with the
+        size (and, when verifying, the SHA256) of their stanza are kept and
+        the shared pool is tried next
+        :param staged: list of (package, package url, package path) tuples
+        :return: list of (package, package url, package path) tuples
+        """
+        journal = self.journal if self.journal.plan is not None else None
+        files = []
+        for package, package_file, package_path in staged:
+            sha256 = package.get('SHA256')
+            if journal is not None and journal.is_done(package['Filename']) and \
+                    is_present(package_path, package.get('Size')):
+                stats.count('repository.journaled')
+                continue
+            if is_present(package_path, package.get('Size'), sha256, self.hash_cache):
+                stats.count('repository.present')
+                continue
+            if self.pool is not None and sha256 and self.pool.link_to(sha256, package_path):
+                stats.count('repository.pooled')
+                continue
+            files.append((package, package_file, package_path))
+        return files
+
+    def _download_jobs(self, files, mirrors=None):
+        """
+        Return the DownloadJob objects of a group of missing files
+        :param mirrors: optional dictionary of package Filename and list of
+            alternative base urls, tried when the package url fails
+        """
+        from scheduler import DownloadJob
+
+        journal = self.journal if self.journal.plan is not None else None
+        mirrors = mirrors or {}
+        jobs = []
+        for package, package_file, package_path in files:
+            done = None
+            if journal is not None:
+                done = lambda url, package_path, filename=package['Filename']: journal.mark_done(filename)
+            urls = [package_file] + [os.path.join(base_url, package['Filename'])
+                                     for base_url in mirrors.get(package['Filename'], ())]
+            jobs.append(DownloadJob(urls, package_path, int(package.get('Size') or 0), done))
+        return jobs
+
+    def _store_files(self, files, failed_paths):
+        """
+        Add the downloaded files to the shared pool and save the hash cache
+        """
+        if self.pool is not None:
+            for package, package_file, package_path in files:
+                if package.get('SHA256') and package_path not in failed_paths:
+                    self.pool.add(package['SHA256'], package_path)
+        if self.hash_cache is not None:
+            self.hash_cache.save()
+
+    def _fetch_packages(self, staged, workers=4, mirrors=None):
+        """
+        Get the files of staged packages, see _missing_files
+        :param staged: list of (package, package url, package path) tuples
+        :param workers: number of simultaneous downloads
+        :param mirrors: optional dictionary of package Filename and list of alternative base urls
+        """
+        _fetch_files([(self, self._missing_files(staged), mirrors)], workers)
 
     def add_package(self, package):
         """
         Add a new package to repository
         :param package: Package object
-        :param package_file: path (url or local) to package file
         """
-        package_file = os.path.join(package.base_url, package['Filename'])
-        download_package = False
-        new_package_name = package['Package']
-        if not new_package_name in self.packages:
-            self.packages[new_package_name] = package
-            download_package = True
-        else:
-            if package['Version'] > self.packages[new_package_name]['Version']:
-                self.remove_package(new_package_name)
-                self.add_package(package, package_file)
-                # self.packages[new_package_name] = package
-                # download_package = True
-        if download_package:
-            package_path = os.path.join(self.path, self.packages[new_package_name]['Filename'])
-            package_dir, package_filename = os.path.split(package_path)
-            try:
-                os.makedirs(package_dir)
-            except:
-                pass
-            Download.download(package_file, package_path)
+        staged = self._stage_package(package)
+        if staged:
+            self._fetch_packages([(package,) + staged])
+
+    def add_packages(self, packages, workers=4, mirrors=None):
+        """
+        Add a group of packages to repository downloading them concurrently
+        :param packages: iterable of package objects
+        :param workers: number of simultaneous downloads
+        :param mirrors: optional dictionary of package Filename and list of
+            alternative base urls, see SourceRepository.get_mirrors
+        """
+        self._fetch_packages(self._stage_packages(packages), workers=workers, mirrors=mirrors)
+
+    def begin_transaction(self, action, packages, roots=(), recommends=False, suggests=False, mirrors=None):
+        """
+        Journal the packages an action is going to add, see apply_transaction
+        """
+        self.journal.begin(action, packages, roots, recommends, suggests, mirrors)
 
-    def rebuild_repo_index(self):
+    def apply_transaction(self, workers=4):
         """
-        Rebuild the packages index file
+        Add the packages of the journaled transaction, record its roots and
+        commit the index. Files completed by an interrupted run are not
+        fetched again and the index is only written at the end
+        :param workers: number of simultaneous downloads
+        """
+        apply_transactions([self], workers)
+
+    def _write_unchanged(self, writer):
         """
-        packages_index_dir, packages_index_filename = os.path.split(self.packages_index_path)
-        if packages_index_dir.startswith('file:'):
-            packages_index_dir = packages_index_dir.replace('file:', '', 1)
+        Copy the stanzas of the loaded index whose package did not change,
+        contiguous stanzas are copied as a single block
+        :return: set of written package names
+        """
+        store = self.index_store
+        written = set()
+        if store is None:
+            return written
+        run_start = None
+        run_end = None
+        for index in range(len(store)):
+            name = store.package_name(index)
+            package = self.packages.get(name)
+            if isinstance(package, PackageRecord) and package.store is store and package.index == index \
+                    and name not in written:
+                written.add(name)
+                if run_start is None:
+                    run_start = store.offset[index]
+                run_end = store.offset[index] + store.length[index]
+            elif run_start is not None:
+                self._write_block(writer, run_start, run_end)
+                run_start = None
+        if run_start is not None:
+            self._write_block(writer, run_start, run_end)
+        return written
+
+    def _write_block(self, writer, start, end):
+        data = self.index_store.stanzas
+        for position in range(start, end, BUFFER_SIZE):
+            writer.write(bytes(data[position:min(position + BUFFER_SIZE, end)]))
+        if data[end - 1:end] != b'\n':
+            writer.write(b'\n')
+        writer.write(b'\n')
+
+    def rebuild_repo_index(self, release=True):
+        """
+        Rebuild the packages index files (Packages, Packages.gz, Packages.xz) and the Release file,
+        stanzas of untouched packages are copied verbatim from the current index
+        :param release: write the Release file too, see write_tinp_release
+        """
+        if not self.changed and self.index_store is not None and os.path.exists(self.release_path):
+            return
         try:
-            os.makedirs(packages_index_dir)
+            os.makedirs(self.packages_index_dir)
         except:
             pass
-        # write packages text file
-        packages_index_file = open(self.packages_index_path, 'wb')        
-        for pack_key in self.packages:
-            self.packages[pack_key].dump(fd=packages_index_file)
-            packages_index_file.write('\n'.encode('utf-8'))
-        packages_index_file.close()
-        # create gziped file
-        import gzip
-        f_in = open(self.packages_index_path, 'rb')
-        f_out = gzip.open(self.packages_index_path+'.gz', 'wb')
-        f_out.writelines(f_in)
-        f_out.close()
-        f_in.close()
+        with stats.timer('index.write'):
+            self._write_index()
+            if release:
+                write_tinp_release([self])
+        self.changed = False
+        self._delete_obsolete()
+
+    def _write_index(self):
+        writer = IndexWriter(self.packages_index_dir, self.packages_index_filename)
+        try:
+            written = self._write_unchanged(writer)
+            for pack_key in self.packages:
+                package = self.packages[pack_key]
+                # virtual package names point to the stanza of their provider
+                if package['Package'] in written:
+                    continue
+                written.add(package['Package'])
+                package.dump(fd=writer)
+                writer.write('\n'.encode('utf-8'))
+        except:
+            writer.abort()
+            raise
+        files = writer.close()
+        stats.count('index.written_bytes', sum(size for size, checksums in files.values()))
+        self.index_files = dict(('%s/%s/%s' % (self.component, self.arch_dir, filename), files[filename])
+                                for filename in files)
+
+
+def _chain_done(first, second):
+    if first is None or second is None:
+        return first or second
+
+    def done(url, filename):
+        first(url, filename)
+        second(url, filename)
+
+    return done
+
+
+def _fetch_files(pending, workers=4):
+    """
+    Download the missing files of one or more tinP repositories sharing a
+    directory (one per architecture) in a single scheduler run, a file
+    needed by several of them (arch: all packages) is downloaded once
+    :param pending: list of (TinpRepository, missing files, mirrors) tuples
+    :param workers: number of simultaneous downloads
+    """
+    # the download modules are only imported by commands fetching files
+    from scheduler import DownloadScheduler
+
+    jobs = {}
+    for tinp, files, mirrors in pending:
+        for job in tinp._download_jobs(files, mirrors):
+            if job.filename in jobs:
+                jobs[job.filename].done = _chain_done(jobs[job.filename].done, job.done)
+            else:
+                jobs[job.filename] = job
+    scheduler = pending[0][0].scheduler or DownloadScheduler(workers=workers)
+    failed = scheduler.run(jobs.values())
+    failed_paths = set(job.filename for job, error in failed)
+    for tinp, files, mirrors in pending:
+        tinp._store_files(files, failed_paths)
+    if failed:
+        raise DownloadError('%d files could not be downloaded: %s' %
+                      (len(failed), ', '.join('%s (%s)' % (job.urls[0], error) for job, error in failed)))
+
+
+def _providers(packages, present):
+    """
+    Return the virtual names provided by a group of packages
+    :param packages: iterable of package objects
+    :param present: only providers in this dictionary are returned
+    :return: dictionary of virtual name and sorted provider names
+    """
+    providers = {}
+    for package in packages:
+        name = package['Package']
+        if name not in present:
+            continue
+        for group in relation_names(package, 'provides'):
+            for virtual in group:
+                if name not in providers.setdefault(virtual, []):
+                    providers[virtual].append(name)
+    return dict((virtual, sorted(names)) for virtual, names in providers.items())
+
+
+def apply_transactions(repositories, workers=4):
+    """
+    Apply the journaled transactions of the architectures of a tinP
+    repository together: the files of all of them are fetched in a single
+    run, every packages index is rebuilt and one Release is written.
+    Requested names that could not be recorded as roots are left in the
+    unresolved_roots attribute of every repository
+    :param repositories: TinpRepository objects sharing a path
+    :param workers: number of simultaneous downloads
+    """
+    pending = []
+    added = {}
+    for tinp in repositories:
+        journal = tinp.journal
+        if journal.plan is None:
+            journal.load()
+        added[tinp] = journal.packages()
+        staged = tinp._stage_packages(added[tinp])
+        pending.append((tinp, tinp._missing_files(staged), journal.mirrors()))
+    _fetch_files(pending, workers)
+    for tinp in repositories:
+        plan = tinp.journal.plan
+        tinp.unresolved_roots = []
+        if plan['roots']:
+            tinp.unresolved_roots = tinp.add_roots(plan['roots'], plan['recommends'], plan['suggests'],
+                                                   added[tinp])
+        tinp.rebuild_repo_index(release=False)
+    write_tinp_release(repositories)
+    for tinp in repositories:
+        tinp.journal.finish()
+
+
+def write_tinp_release(repositories):
+    """
+    Write the Release file of a tinP repository. It lists the packages
+    indexes of every architecture, the entries of the architectures not
+    rebuilt in this run are kept from the current Release
+    :param repositories: TinpRepository objects sharing a path
+    """
+    rebuilt = [tinp for tinp in repositories if tinp.index_files is not None]
+    if not rebuilt:
+        return
+    files, architectures = read_release(rebuilt[0].release_path)
+    for tinp in rebuilt:
+        prefix = '%s/%s/' % (tinp.component, tinp.arch_dir)
+        files = dict((path, entry) for path, entry in files.items() if not path.startswith(prefix))
+        files.update(tinp.index_files)
+        architecture = tinp.arch.replace('binary-', '', 1)
+        if architecture not in architectures:
+            architectures.append(architecture)
+    write_release(rebuilt[0].release_path, files, architectures=architectures)
 
 
 class SourceRepository(Repository):
 
-    def __init__(self, sources, packages=[], arch='binary-i386'):
+    def __init__(self, sources, packages=[], arch='binary-i386', cache=None, workers=4):
         """
         Creates a new source (origin) repository instance
         :param sources: Source repositories
         :param packages: Dictionary of package objects following a deb822 instance
         :param arch: repository architecture
+        :param cache: IndexCache for the packages indexes, None to always download them
+        :param workers: number of sections loaded at the same time
         """
         Repository.__init__(self, packages, arch)
         self.sources = sources
+        self.cache = cache
+        self.workers = workers
+        self.resolver = None
+        self.index = None
+        self.search_index = None
+        self.mirrors = {}
 
-    def load_packages(self):
+    def load_packages(self, parse_pool=None):
         """
         load packages from packages indexs
+        :param parse_pool: optional ParsePool shared with other loads
+        """
+        self.mirrors = {}
+        self.packages = get_packages(self.sources, arch=self.arch, cache=self.cache, workers=self.workers,
+                                     mirrors=self.mirrors, parse_pool=parse_pool)
+        self.index = None
+        self.search_index = None
+
+    def get_mirrors(self, packages):
+        """
+        Return the other sources carrying the same files (same Filename and
+        SHA256) as a group of packages
+        :param packages: iterable of package objects
+        :return: dictionary of package Filename and list of alternative base urls
         """
-        self.packages = get_packages(self.sources, arch=self.arch)
+        return get_mirrors(packages, self.mirrors)
 
-    def get_package_tree(self, package_name, recommends=False, suggests=False, packages_dict = {}):
+    def get_index(self):
+        """
+        Return the PackageIndex (reverse dependencies, providers, sections)
+        of the loaded packages, it is saved with the packages cache
+        """
+        if self.index is None:
+            self.index = get_package_index(self.packages, self.sources, arch=self.arch, cache=self.cache)
+        return self.index
+
+    def get_search_index(self):
+        """
+        Return the SearchIndex (name, description, section and provides
+        words) of the loaded packages, it is saved with the packages cache
+        """
+        if self.search_index is None:
+            from search import get_search_index
+
+            self.search_index = get_search_index(self.packages, self.sources, arch=self.arch, cache=self.cache)
+        return self.search_index
+
+    def get_resolver(self):
+        """
+        Return the dependency resolver for the loaded packages
+        """
+        if self.resolver is None or self.resolver.packages is not self.packages:
+            self.resolver = DependencyResolver(self.packages)
+        return self.resolver
+
+    def get_packages_tree(self, package_names, recommends=False, suggests=False):
+        """
+        get the complete dependency tree of a group of packages in one pass
+        :param package_names: packages heads
+        :param recommends: search for recommended packages too
+        :param suggests: search for suggested packages too
+        :return: packages dictionary
+        """
+        return self.get_resolver().tree(package_names, recommends=recommends, suggests=suggests)
+
+    def get_package_tree(self, package_name, recommends=False, suggests=False, packages_dict=None):
         """
         get a complete package dependency tree
         :param package_name: packege head
         :param recommends: search for recommended packages too
+        :param packages_dict: dictionary the tree is added to
         :return: packages list
         """
-
-        if not package_name in self.packages:
-            return packages_dict
-        head_package = self.packages[package_name]
-        if not package_name in packages_dict:
-            packages_dict[package_name] = head_package
-            rels = head_package.relations
-            relations = rels['depends']
-            if recommends:
-                relations = relations + rels['recommends']
-            if suggests:
-                relations = relations + rels['suggests']
-            for deps in relations:
-                news = self.get_package_tree(deps[0]['name'], packages_dict=packages_dict)
-                # packages_dict = join_dicts(packages_dict,
-                #                            self.get_package_tree(deps[0]['name'], packages_dict=packages_dict))
-                for key in news:
-                    if not key in packages_dict:
-                        packages_dict[key] = news[key]
+        tree = self.get_packages_tree([package_name], recommends=recommends, suggests=suggests)
+        if packages_dict is None:
+            return tree
+        for key in tree:
+            if not key in packages_dict:
+                packages_dict[key] = tree[key]
         return packages_dict
 
 
+def load_source_repositories(sources, archs, cache=None, workers=4, parse_pool=None):
+    """
+    Load the packages of the origin repositories for several
+    architectures at the same time, sharing the index cache and the parse pool
+    :param sources: Source repositories
+    :param archs: list of architectures (ex: ["binary-amd64", "binary-i386"])
+    :param parse_pool: optional ParsePool kept by the caller between loads,
+        a private one is used by default
+    :return: list of loaded SourceRepository objects, in archs order
+    """
+    repositories = [SourceRepository(sources, arch=arch, cache=cache, workers=workers) for arch in archs]
+    if len(repositories) == 1:
+        repositories[0].load_packages(parse_pool)
+        return repositories
+    from multiprocessing.pool import ThreadPool
+
+    private_pool = parse_pool is None
+    if private_pool:
+        parse_pool = ParsePool()
+    pool = ThreadPool(len(repositories))
+    try:
+        pool.map(lambda repository: repository.load_packages(parse_pool), repositories)
+    finally:
+        pool.close()
+        pool.join()
+        if private_pool:
+            parse_pool.close()
+    return repositories
+
+
 
 # from parsers import get_repositories
 # repos = get_repositories("/etc/apt/sources.list")
@@ -203,4 +687,4 @@ class SourceRepository(Repository):
 # tinp = TinpRepository('/home/cccaballero/Escritorio/repotest')
 # for p in packages:
 #     tinp.add_package(packages[p])
-# tinp.rebuild_repo_index()
\ No newline at end of file
+# tinp.rebuild_repo_index()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# resolver.py
+#
+# Copyright 2014 Carlos Cesar Caballero Diaz <ccesar@linuxmail.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+__author__ = 'cccaballero'
+
+from collections import deque
+from store import PackageRecord
+import stats
+
+# relations a package cannot be installed without, followed by the
+# dependency closure and by the garbage collection of tinP repositories
+REQUIRED_RELATIONS = ('pre-depends', 'depends')
+
+
+def relation_names(package, kind):
+    """
+    Return a package relation as lists of alternative package names
+    :param package: package object
+    :param kind: relation kind (depends, recommends, ...)
+    :return: list of alternative groups, each one a list of package names
+    """
+    if isinstance(package, PackageRecord):
+        return package.store.relation(package.index, kind)
+    return [[dep['name'] for dep in group] for group in package.relations[kind]]
+
+
+class DependencyResolver(object):
+
+    def __init__(self, packages):
+        """
+        Dependency closure engine. Package names are mapped to integer ids
+        and the required adjacency of every visited package is kept as a
+        tuple of ids, so repeated closures never parse relations again
+        :param packages: dictionary of package name and package object
+        """
+        self.packages = packages
+        self.names = list(packages)
+        self.ids = dict((name, node) for node, name in enumerate(self.names))
+        self.adjacency = [None] * len(self.names)
+        self.closures = {}
+
+    def adjacent(self, node):
+        """
+        Return the ids of the packages a package pre-depends or depends on,
+        like apt the first alternative of every group is taken
+        """
+        adjacent = self.adjacency[node]
+        if adjacent is None:
+            adjacent = []
+            package = self.packages[self.names[node]]
+            for kind in REQUIRED_RELATIONS:
+                for group in relation_names(package, kind):
+                    if group and group[0] in self.ids:
+                        adjacent.append(self.ids[group[0]])
+            adjacent = self.adjacency[node] = tuple(adjacent)
+        return adjacent
+
+    def closure(self, roots):
+        """
+        Return the ids of all the packages needed by the roots. The graph
+        is walked breadth first so depth is not limited by the recursion
+        limit, and closures already computed for single roots are reused
+        instead of walked again
+        :param roots: package ids
+        :return: set of package ids
+        """
+        roots = list(roots)
+        if len(roots) == 1 and roots[0] in self.closures:
+            stats.count('resolver.cached_closures')
+            return set(self.closures[roots[0]])
+        visited = set(roots)
+        queue = deque(visited)
+        walked = 0
+        while queue:
+            node = queue.popleft()
+            walked += 1
+            known = self.closures.get(node)
+            if known is not None:
+                visited.update(known)
+                continue
+            for dependency in self.adjacent(node):
+                if dependency not in visited:
+                    visited.add(dependency)
+                    queue.append(dependency)
+        stats.count('resolver.nodes', walked)
+        if len(roots) == 1:
+            self.closures[roots[0]] = frozenset(visited)
+        return visited
+
+    def roots(self, package_names, recommends=False, suggests=False):
+        """
+        Return the root ids for a group of packages, recommended and
+        suggested packages are only taken from the requested packages
+        """
+        roots = []
+        for name in package_names:
+            if name not in self.ids:
+                continue
+            roots.append(self.ids[name])
+            kinds = (['recommends'] if recommends else []) + (['suggests'] if suggests else [])
+            for kind in kinds:
+                for group in relation_names(self.packages[name], kind):
+                    if group and group[0] in self.ids:
+                        roots.append(self.ids[group[0]])
+        return roots
+
+    def path(self, roots, package_name):
+        """
+        Return a shortest chain of dependencies from the roots to a package,
+        following the same edges as tree. A virtual name in the chain is
+        followed by the package it was resolved to
+        :param roots: dictionary of root name and its flags (see RootsManifest)
+        :param package_name: name of the package to explain
+        :return: list of package names from a root to the package, None if no root needs it
+        """
+        parents = {}
+        queue = deque()
+        for name in sorted(roots):
+            flags = roots[name]
+            heads = self.roots([name], recommends=flags.get('recommends', False),
+                               suggests=flags.get('suggests', False))
+            for position, node in enumerate(heads):
+                if node not in parents:
+                    # recommended and suggested packages hang from their root
+                    parents[node] = heads[0] if position else None
+                    queue.append(node)
+        found = None
+        while queue:
+            node = queue.popleft()
+            if self.packages[self.names[node]]['Package'] == package_name:
+                found = node
+                break
+            for dependency in self.adjacent(node):
+                if dependency not in parents:
+                    parents[dependency] = node
+                    queue.append(dependency)
+        if found is None:
+            return None
+        chain = []
+        while found is not None:
+            chain.append(found)
+            found = parents[found]
+        names = []
+        for node in reversed(chain):
+            name = self.names[node]
+            names.append(name)
+            real_name = self.packages[name]['Package']
+            if real_name != name:
+                names.append(real_name)
+        return names
+
+    def tree(self, package_names, recommends=False, suggests=False):
+        """
+        Return the complete dependency tree of a group of packages
+        :param package_names: names of the head packages
+        :param recommends: add recommended packages of the head packages
+        :param suggests: add suggested packages of the head packages
+        :return: dictionary of package name and package object
+        """
+        with stats.timer('resolver.tree'):
+            nodes = self.closure(self.roots(package_names, recommends, suggests))
+        return dict((self.names[node], self.packages[self.names[node]]) for node in nodes)
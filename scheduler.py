@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# scheduler.py
+#
+# Copyright 2014 Carlos Cesar Caballero Diaz <ccesar@linuxmail.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+__author__ = 'cccaballero'
+
+import os
+import re
+import sys
+import time
+import threading
+from collections import deque
+from contrib.unwrapt import Download
+import stats
+if sys.version >= '3':
+    from urllib.parse import urlsplit
+    import http.client as httplib
+else:
+    from urlparse import urlsplit
+    import httplib
+
+_RATE_RE = re.compile(r'^\s*([0-9.]+)\s*([kKmMgG]?)[bB]?\s*$')
+_RATE_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
+
+def parse_rate(rate):
+    """
+    Parse a transfer rate like "500k" or "2M"
+    :return: bytes per second
+    """
+    match = _RATE_RE.match(rate)
+    if not match:
+        raise ValueError("Invalid rate: %s" % rate)
+    return int(float(match.group(1)) * _RATE_UNITS[match.group(2).lower()])
+
+
+def url_host(url):
+    """
+    Return the host an url is fetched from, local files share a single "file" host
+    """
+    if url.startswith('file:'):
+        return 'file'
+    return urlsplit(url).netloc
+
+
+class RateLimiter(object):
+
+    def __init__(self, rate):
+        """
+        Token bucket shared by all the downloads of a run
+        :param rate: bytes per second
+        """
+        self.rate = float(rate)
+        self.allowance = self.rate
+        self.last = time.time()
+        self.lock = threading.Lock()
+
+    def consume(self, amount):
+        """
+        Take transferred bytes from the bucket, sleeping while it is empty
+        """
+        with self.lock:
+            now = time.time()
+            self.allowance = min(self.rate, self.allowance + (now - self.last) * self.rate)
+            self.last = now
+            self.allowance -= amount
+            wait = -self.allowance / self.rate if self.allowance < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+class DownloadJob(object):
+
+    def __init__(self, urls, filename, size=0, done=None):
+        """
+        A file to download and the mirrors carrying it
+        :param urls: urls of the file, in order of preference
+        :param filename: local path
+        :param size: expected size, larger files are started first
+        :param done: optional callable called once the file is downloaded
+        """
+        self.urls = urls
+        self.filename = filename
+        self.size = size
+        self.done = done
+        self.failures = {}
+
+
+class DownloadScheduler(object):
+
+    def __init__(self, workers=4, per_host=None, retries=3, backoff=1.0, rate=None, progress=True):
+        """
+        Downloads files from several mirrors. Large files start first,
+        every host gets at most per_host simultaneous downloads, the least
+        busy (and least failing) mirror of a file is chosen, failed files
+        are retried on the other mirrors and then again after a backoff
+        :param workers: simultaneous downloads
+        :param per_host: simultaneous downloads per host, None for no limit
+        :param retries: rounds over all the mirrors of a file before giving up
+        :param backoff: seconds to wait before the second round, doubled on every round
+        :param rate: optional global bandwidth cap in bytes per second
+        :param progress: show the aggregate progress
+        """
+        self.workers = workers
+        self.per_host = per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.limiter = RateLimiter(rate) if rate else None
+        self.progress = progress
+        self.condition = threading.Condition()
+        self.active = {}
+        self.host_failures = {}
+
+    def _acquire(self, job, tried):
+        """
+        Wait for a free mirror of a job and take a slot on it
+        :param tried: urls already tried in the current round
+        :return: url
+        """
+        candidates = [url for url in job.urls if url not in tried] or list(job.urls)
+        with self.condition:
+            while True:
+                free = [url for url in candidates
+                        if self.per_host is None or self.active.get(url_host(url), 0) < self.per_host]
+                if free:
+                    url = min(free, key=lambda url: (self.host_failures.get(url_host(url), 0),
+                                                     self.active.get(url_host(url), 0),
+                                                     candidates.index(url)))
+                    host = url_host(url)
+                    self.active[host] = self.active.get(host, 0) + 1
+                    return url
+                self.condition.wait()
+
+    def _release(self, url, failed):
+        host = url_host(url)
+        with self.condition:
+            self.active[host] -= 1
+            if failed:
+                self.host_failures[host] = self.host_failures.get(host, 0) + 1
+            self.condition.notify_all()
+
+    def _progress(self, aggregate, size=0):
+        """
+        Return the progress callback of a job, shared by all its attempts
+        """
+        file_progress = aggregate.file_progress(size) if aggregate else None
+        limiter = self.limiter
+        if limiter is None:
+            return file_progress or _no_progress
+        state = {'current': 0}
+
+        def progress(display, current, total):
+            # a resumed attempt starts at the offset reached before
+            limiter.consume(max(0, current - state['current']))
+            state['current'] = current
+            if file_progress:
+                file_progress(display, current, total)
+
+        return progress
+
+    def fetch(self, job, aggregate=None, session=None):
+        """
+        Download a single job trying its mirrors
+        :param aggregate: optional AggregateProgress of the group
+        :param session: optional DownloadSession reusing connections
+        """
+        error = None
+        progress = self._progress(aggregate, job.size)
+        for attempt in range(max(1, self.retries)):
+            if attempt:
+                stats.count('download.retries')
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            tried = set()
+            for _ in job.urls:
+                url = self._acquire(job, tried)
+                tried.add(url)
+                failed = True
+                try:
+                    Download.download(url, job.filename, progress=progress, session=session, recorder=stats)
+                    failed = False
+                except (IOError, OSError, httplib.HTTPException) as e:
+                    stats.count('download.failures')
+                    job.failures[url] = e
+                    error = e
+                    # do not resume from a partial file of another mirror
+                    if len(job.urls) > 1 and os.path.exists(job.filename):
+                        os.remove(job.filename)
+                    continue
+                except Exception as e:
+                    # not a transfer error (bad credentials, a malformed
+                    # header), the job fails without trying other mirrors
+                    stats.count('download.failures')
+                    job.failures[url] = e
+                    raise
+                finally:
+                    # the slot is always given back, other workers wait for it
+                    self._release(url, failed)
+                if job.done is not None:
+                    job.done(url, job.filename)
+                return
+        raise error
+
+    def run(self, jobs):
+        """
+        Download a group of jobs, every file is tried even if others fail
+        :param jobs: iterable of DownloadJob objects
+        :return: list of (job, error) tuples of the files that could not be downloaded
+        """
+        jobs = sorted(jobs, key=lambda job: -job.size)
+        if not jobs:
+            return []
+        aggregate = None
+        if self.progress:
+            aggregate = Download.AggregateProgress(len(jobs), sum(job.size for job in jobs))
+        session = Download.get_session()
+        queue = deque(jobs)
+        failed = []
+        lock = threading.Lock()
+
+        def worker():
+            while True:
+                with lock:
+                    if not queue:
+                        return
+                    job = queue.popleft()
+                try:
+                    self.fetch(job, aggregate, session)
+                except Exception as e:
+                    with lock:
+                        failed.append((job, e))
+                if aggregate:
+                    aggregate.file_done()
+
+        threads = [threading.Thread(target=worker) for _ in range(max(1, min(self.workers, len(jobs))))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return failed
+
+
+def _no_progress(display, current, total):
+    pass
@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# search.py
+#
+# Copyright 2014 Carlos Cesar Caballero Diaz <ccesar@linuxmail.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+__author__ = 'cccaballero'
+
+import re
+from parsers import get_section_index
+from planner import is_fetched
+from resolver import relation_names
+from store import PackageRecord
+
+# bump when the SearchIndex layout changes, older cached indexes are rebuilt
+SEARCH_INDEX_VERSION = 1
+FIELDS = ('name', 'description', 'section', 'provides')
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def tokens(text):
+    """
+    Split a text in lowercase words
+    """
+    return _TOKEN_RE.findall(text.lower())
+
+
+def description(package, long=False):
+    """
+    Return the description of a package, the stanza of a PackageRecord is
+    scanned for the field instead of parsed whole
+    :param long: return the long description lines too, not only the first line
+    """
+    if not isinstance(package, PackageRecord):
+        text = package.get('Description') or ''
+        return text if long else text.split('\n', 1)[0].strip()
+    stanza = b'\n' + package.store.stanza(package.index)
+    start = stanza.find(b'\nDescription:')
+    if start < 0:
+        return ''
+    start += len(b'\nDescription:')
+    end = stanza.find(b'\n', start)
+    if long:
+        # continuation lines start with a space
+        while end >= 0 and stanza[end + 1:end + 2] in (b' ', b'\t'):
+            end = stanza.find(b'\n', end + 1)
+    text = stanza[start:end if end >= 0 else len(stanza)]
+    return text.decode('utf-8', 'replace').strip()
+
+
+class SearchIndex(object):
+
+    def __init__(self, postings=None):
+        """
+        Inverted index of a packages dictionary: words of the package
+        names and descriptions, sections and provided names, each one
+        mapped to the names of the packages carrying it
+        :param postings: dictionary of field (see FIELDS) and dictionary of word and package names
+        """
+        self.postings = postings or dict((field, {}) for field in FIELDS)
+
+    @classmethod
+    def from_packages(cls, packages):
+        """
+        Build the index of a packages dictionary, virtual names are skipped
+        :param packages: dictionary of package name and package object
+        :return: SearchIndex
+        """
+        postings = dict((field, {}) for field in FIELDS)
+
+        def post(field, words, name):
+            words = set(words)
+            for word in words:
+                postings[field].setdefault(word, []).append(name)
+
+        for name in packages:
+            package = packages[name]
+            if package['Package'] != name:
+                continue
+            post('name', [name] + tokens(name), name)
+            post('description', tokens(description(package, long=True)), name)
+            section = package.get('Section')
+            if section:
+                # "universe/python" is found as "python" too
+                post('section', [section, section.rsplit('/', 1)[-1]], name)
+            post('provides', [virtual for group in relation_names(package, 'provides') for virtual in group], name)
+        return cls(dict((field, dict((word, tuple(names)) for word, names in words.items()))
+                        for field, words in postings.items()))
+
+    def lookup(self, field, word):
+        """
+        Return the names of the packages with a word in a field
+        """
+        return self.postings[field].get(word, ())
+
+    def _match(self, term):
+        """
+        Return the names of the packages matching a single search term
+        """
+        field, _, value = term.partition(':')
+        if field in FIELDS:
+            if field in ('name', 'description'):
+                words = tokens(value)
+                names = set(self.lookup(field, value.lower())) if field == 'name' else set()
+                if words:
+                    found = set(self.lookup(field, words[0]))
+                    for word in words[1:]:
+                        found.intersection_update(self.lookup(field, word))
+                    names.update(found)
+                return names
+            return set(self.lookup(field, value))
+        names = set(self.lookup('name', term.lower()))
+        words = tokens(term)
+        if words:
+            found = None
+            for word in words:
+                matches = set(self.lookup('name', word))
+                matches.update(self.lookup('description', word))
+                matches.update(self.lookup('provides', word))
+                found = matches if found is None else found & matches
+            names.update(found)
+        return names
+
+    def search(self, terms):
+        """
+        Return the packages matching all the terms. A term is a word of the
+        package name, description or provided names, an exact package
+        name, or a "field:value" term (ex: "section:python",
+        "provides:mail-transport-agent", "name:perl")
+        :param terms: list of search terms
+        :return: package names, exact name matches first, then the ones
+            with all the term words in their name
+        """
+        if not terms:
+            return []
+        names = self._match(terms[0])
+        for term in terms[1:]:
+            names.intersection_update(self._match(term))
+        exact = set(term.lower() for term in terms)
+        words = set(word for term in terms if ':' not in term for word in tokens(term))
+
+        def rank(name):
+            name_words = set(tokens(name))
+            return (name not in exact, not words or not words.issubset(name_words), name)
+
+        return sorted(names, key=rank)
+
+
+def get_search_index(packages, sections, arch='binary-i386', packages_index_filename='Packages.gz', cache=None):
+    """
+    Return the SearchIndex of packages loaded from repository sections,
+    reusing the one saved in the cache when none of the indexes changed
+    :param packages: packages dictionary returned by get_packages
+    :param sections: repository sections the packages were loaded from
+    :param cache: IndexCache the packages were loaded with, None to always build it
+    :return: SearchIndex
+    """
+    build = lambda: SearchIndex.from_packages(packages)
+    if cache is None:
+        return build()
+    urls = [get_section_index(section, arch, packages_index_filename, cache)[0] for section in sections]
+    key = cache.key_for(urls)
+    if key is None:
+        return build()
+    return cache.derived('search-index:%s' % arch, 'v%d:%s' % (SEARCH_INDEX_VERSION, key), build)
+
+
+def search_summary(source, terms):
+    """
+    Search the packages of a source repository
+    :param source: SourceRepository with its packages loaded
+    :param terms: list of search terms (see SearchIndex.search)
+    :return: list of [name, version, section, short description] lists
+    """
+    result = []
+    for name in source.get_search_index().search(terms):
+        package = source.packages[name]
+        result.append([name, package['Version'], package.get('Section', ''), description(package)])
+    return result
+
+
+def closure_summary(source, tinp, package_names, recommends=False, suggests=False):
+    """
+    Return what adding packages would bring in, as plain data
+    :param source: SourceRepository with its packages loaded
+    :param tinp: TinpRepository the packages would be added to
+    :param package_names: names of the head packages
+    :return: dictionary with "packages" ([name, version, size, fetched]
+        lists, fetched is True when the file needs no download), "not_found"
+        (names), "total_size" and "download_size" (see UpgradePlan.transfer_size)
+    """
+    tree = source.get_packages_tree(package_names, recommends=recommends, suggests=suggests)
+    packages = {}
+    for name in tree:
+        package = tree[name]
+        packages[package['Package']] = package
+    result = []
+    total_size = download_size = 0
+    for name in sorted(packages):
+        package = packages[name]
+        size = int(package.get('Size', 0))
+        fetched = is_fetched(tinp, package)
+        total_size += size
+        if not fetched:
+            download_size += size
+        result.append([name, package['Version'], size, fetched])
+    return {'packages': result,
+            'not_found': [name for name in package_names if name not in source.packages],
+            'total_size': total_size,
+            'download_size': download_size}
+
+
+def why_summary(source, tinp, package_name, roots=None, recommends=False, suggests=False):
+    """
+    Explain why a package is needed
+    :param source: SourceRepository with its packages loaded
+    :param tinp: TinpRepository whose root packages are explained when no roots are given
+    :param package_name: name of the package
+    :param roots: optional names of head packages, with the recommends and suggests flags
+    :return: list of package names from a root to the package, None if no root needs it
+    """
+    if roots:
+        roots = dict((name, {'recommends': recommends, 'suggests': suggests}) for name in roots)
+    else:
+        roots = tinp.get_manifest().roots
+    return source.get_resolver().path(roots, package_name)
@@ -0,0 +1,459 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# service.py
+#
+# Copyright 2014 Carlos Cesar Caballero Diaz <ccesar@linuxmail.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+__author__ = 'cccaballero'
+
+import sys
+import json
+import time
+import inspect
+import threading
+import traceback
+from cache import IndexCache
+from contrib.unwrapt.utils import url_join
+from parsers import get_release_files, ParsePool
+from planner import plan_upgrade
+from search import search_summary, closure_summary, why_summary
+from repository import TinpRepository, load_source_repositories, apply_transactions, write_tinp_release
+if sys.version >= '3':
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    string_types = (str,)
+    getargspec = inspect.getfullargspec
+else:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    string_types = (basestring,)
+    getargspec = inspect.getargspec
+
+DEFAULT_ADDRESS = ('127.0.0.1', 8642)
+
+
+class TinpService(object):
+
+    def __init__(self, repo_path, sections, archs, cache_dir=None, jobs=4, pool=None, verify=False, scheduler=None,
+                 refresh=300):
+        """
+        Resident tinP service. The origin indexes, their resolvers and the
+        tinP repositories are kept in memory between requests, and the
+        origin Release files are checked in the background so the indexes
+        are reloaded (from the index cache) only when a mirror changed.
+        Requests changing the repository run one at a time
+        :param repo_path: path of the tinP repository
+        :param sections: origin repository sections
+        :param archs: list of architectures
+        :param cache_dir: index cache directory, None for the default one, False to disable it
+        :param jobs: simultaneous downloads and loaded sections
+        :param pool: optional PackagePool
+        :param verify: check the SHA256 of files already present
+        :param scheduler: optional DownloadScheduler
+        :param refresh: seconds between Release checks, 0 to disable them
+        """
+        self.repo_path = repo_path
+        self.sections = sections
+        self.archs = archs
+        self.cache_dir = cache_dir
+        self.jobs = jobs
+        self.pool = pool
+        self.verify = verify
+        self.scheduler = scheduler
+        self.refresh_interval = refresh
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.fingerprint = None
+        self.reps = []
+        self.tinps = []
+        self.refreshed = None
+        self.parse_pool = None
+
+    def _new_cache(self):
+        # Release files are kept for the life of an IndexCache, every check needs a new one
+        if self.cache_dir is False:
+            return None
+        return IndexCache(self.cache_dir)
+
+    def _fingerprint(self, cache):
+        """
+        Return the files listed in the Release files of the origin repositories
+        """
+        release_urls = sorted(set(url_join(section["surl"], "dists", section["dist"], "Release")
+                                  for section in self.sections))
+        fingerprint = []
+        for release_url in release_urls:
+            files = cache.release_files(release_url) if cache is not None else get_release_files(release_url)
+            fingerprint.append((release_url, sorted(files.items())))
+        return fingerprint
+
+    def _load_sources(self, cache):
+        reps = load_source_repositories(self.sections, self.archs, cache=cache, workers=self.jobs,
+                                        parse_pool=self.parse_pool)
+        for rep in reps:
+            rep.get_resolver()
+            rep.get_index()
+            rep.get_search_index()
+        return reps
+
+    def _load_tinps(self):
+        return [TinpRepository(self.repo_path, arch=arch, pool=self.pool, verify=self.verify,
+                               scheduler=self.scheduler) for arch in self.archs]
+
+    def load(self):
+        """
+        Load the origin indexes and the tinP repositories
+        """
+        if self.parse_pool is None:
+            # shared by every refresh, no load starts its own worker processes
+            self.parse_pool = ParsePool()
+        cache = self._new_cache()
+        fingerprint = self._fingerprint(cache)
+        reps = self._load_sources(cache)
+        with self.lock:
+            self.fingerprint = fingerprint
+            self.reps = reps
+            self.tinps = self._load_tinps()
+            self.refreshed = time.time()
+
+    def refresh(self, force=False):
+        """
+        Reload the origin indexes if a Release file changed. Requests keep
+        using the loaded indexes until the new ones are ready
+        :param force: reload even if no Release file changed
+        :return: True if the indexes were reloaded
+        """
+        cache = self._new_cache()
+        fingerprint = self._fingerprint(cache)
+        if not force and fingerprint == self.fingerprint:
+            return False
+        reps = self._load_sources(cache)
+        with self.lock:
+            self.fingerprint = fingerprint
+            self.reps = reps
+            self.refreshed = time.time()
+        return True
+
+    def _refresh_loop(self):
+        while not self.stopped.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception:
+                traceback.print_exc()
+
+    def start(self):
+        """
+        Start checking the Release files in the background
+        """
+        if self.refresh_interval:
+            thread = threading.Thread(target=self._refresh_loop)
+            thread.daemon = True
+            thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.parse_pool is not None:
+            self.parse_pool.close()
+            self.parse_pool = None
+
+    def _versions(self):
+        return dict((tinp.arch, dict((name, package['Version']) for name, package in tinp.packages.items()
+                                     if package['Package'] == name))
+                    for tinp in self.tinps)
+
+    def _changes(self, before):
+        """
+        Return the packages added, upgraded and removed since a _versions call
+        """
+        after = self._versions()
+        changes = {}
+        for arch in self.archs:
+            old, new = before[arch], after[arch]
+            changes[arch] = {'added': sorted(name for name in new if name not in old),
+                             'upgraded': sorted([name, old[name], new[name]] for name in new
+                                                if name in old and old[name] != new[name]),
+                             'removed': sorted(name for name in old if name not in new)}
+        return changes
+
+    def _apply(self):
+        try:
+            apply_transactions(self.tinps, workers=self.jobs)
+        except:
+            # staged packages of a failed transaction are not in the repository
+            self.tinps = self._load_tinps()
+            raise
+
+    def _not_found(self, changes, tinps):
+        """
+        Add the requested names that could not be recorded as roots to the changes
+        """
+        for tinp in tinps:
+            changes[tinp.arch]['not_found'] = sorted(tinp.unresolved_roots)
+        return changes
+
+    def _loaded(self):
+        """
+        Return the (source repository, tinP repository) pairs, taken under
+        the lock so a request never sees a change half applied
+        """
+        with self.lock:
+            return list(zip(self.reps, self.tinps))
+
+    def _rebuild(self):
+        for tinp in self.tinps:
+            tinp.rebuild_repo_index(release=False)
+        write_tinp_release(self.tinps)
+        if self.pool is not None:
+            self.pool.prune()
+
+    def add(self, packages, recommends=False, suggests=False):
+        """
+        Add packages and their dependencies
+        :param packages: list of package names
+        """
+        with self.lock:
+            before = self._versions()
+            for rep, tinp in zip(self.reps, self.tinps):
+                tree = rep.get_packages_tree(packages, recommends=recommends, suggests=suggests)
+                tinp.begin_transaction('add', tree.values(), packages, recommends, suggests,
+                                       rep.get_mirrors(tree.values()))
+            self._apply()
+            return self._not_found(self._changes(before), self.tinps)
+
+    def add_section(self, sections, recommends=False, suggests=False):
+        """
+        Add every package of sections and their dependencies, all the
+        sections share a single dependency closure and transaction
+        :param sections: list of section names or patterns (see PackageIndex.matching_sections)
+        """
+        with self.lock:
+            before = self._versions()
+            for rep, tinp in zip(self.reps, self.tinps):
+                roots = rep.get_index().section_roots(sections)
+                tree = rep.get_packages_tree(roots, recommends=recommends, suggests=suggests)
+                tinp.begin_transaction('add_section', tree.values(), roots, recommends, suggests,
+                                       rep.get_mirrors(tree.values()))
+            self._apply()
+            return self._not_found(self._changes(before), self.tinps)
+
+    def remove(self, packages):
+        """
+        Remove packages and the dependencies no other package needs
+        :param packages: list of package names
+        """
+        with self.lock:
+            before = self._versions()
+            for tinp in self.tinps:
+                manifest = tinp.get_manifest()
+                for package_name in packages:
+                    manifest.discard(package_name)
+                    if package_name in tinp.packages:
+                        tinp.remove_package(package_name)
+                tinp.collect_garbage()
+            self._rebuild()
+            return self._changes(before)
+
+    def gc(self):
+        """
+        Remove the packages no root package needs
+        """
+        with self.lock:
+            before = self._versions()
+            for tinp in self.tinps:
+                tinp.collect_garbage()
+            self._rebuild()
+            return self._changes(before)
+
+    def upgrade(self, dry_run=False):
+        """
+        Upgrade the repository packages
+        :param dry_run: only return what would be upgraded
+        :return: dictionary of architecture and plan summary if dry_run, changes otherwise
+        """
+        with self.lock:
+            plans = [(rep, tinp, plan_upgrade(tinp, rep)) for rep, tinp in zip(self.reps, self.tinps)]
+            if dry_run:
+                return dict((tinp.arch, plan.summary(tinp)) for rep, tinp, plan in plans)
+            before = self._versions()
+            for rep, tinp, plan in plans:
+                tinp.begin_transaction('upgrade', plan.packages(), mirrors=rep.get_mirrors(plan.packages()))
+            self._apply()
+            return self._changes(before)
+
+    def resume(self):
+        """
+        Resume the unfinished transactions
+        """
+        with self.lock:
+            before = self._versions()
+            tinps = [tinp for tinp in self.tinps if tinp.journal.exists()]
+            if tinps:
+                try:
+                    apply_transactions(tinps, workers=self.jobs)
+                except:
+                    self.tinps = self._load_tinps()
+                    raise
+            return self._not_found(self._changes(before), tinps)
+
+    def search(self, terms):
+        """
+        Search the origin packages
+        :param terms: list of search terms (see SearchIndex.search)
+        :return: dictionary of architecture and list of [name, version, section, description] lists
+        """
+        return dict((rep.arch, search_summary(rep, terms)) for rep, tinp in self._loaded())
+
+    def query(self, packages, recommends=False, suggests=False):
+        """
+        Return what adding packages would bring in, without adding them
+        :param packages: list of package names
+        :return: dictionary of architecture and closure summary (see closure_summary)
+        """
+        return dict((tinp.arch, closure_summary(rep, tinp, packages, recommends, suggests))
+                    for rep, tinp in self._loaded())
+
+    def why(self, package, roots=None, recommends=False, suggests=False):
+        """
+        Explain why a package is needed by the repository root packages, or by other packages
+        :param package: package name
+        :param roots: optional list of head package names
+        :return: dictionary of architecture and dependency chain, None where no root needs the package
+        """
+        # the root packages of the manifests change with every add and remove
+        with self.lock:
+            return dict((tinp.arch, why_summary(rep, tinp, package, roots, recommends, suggests))
+                        for rep, tinp in zip(self.reps, self.tinps))
+
+    def status(self):
+        return {'repository': self.repo_path,
+                'architectures': self.archs,
+                'refreshed': self.refreshed,
+                'busy': self.lock.locked(),
+                'packages': dict((tinp.arch, {'source': len(rep.packages), 'repository': len(tinp.packages)})
+                                 for rep, tinp in zip(self.reps, self.tinps))}
+
+
+ACTIONS = ('add', 'add_section', 'remove', 'gc', 'upgrade', 'resume', 'search', 'query', 'why', 'refresh', 'status')
+# json type of every action argument, "names" is a list of strings
+ARGUMENT_TYPES = {'packages': 'names', 'sections': 'names', 'terms': 'names', 'roots': 'names',
+                  'package': 'name', 'recommends': 'flag', 'suggests': 'flag', 'dry_run': 'flag', 'force': 'flag'}
+
+
+def check_arguments(function, params):
+    """
+    Check the json arguments of a request against the signature of the
+    service action and the types of ARGUMENT_TYPES
+    :param function: bound TinpService method
+    :param params: dictionary of argument name and value
+    :raise ValueError: describing the first wrong argument
+    """
+    spec = getargspec(function)
+    names = spec.args[1:]
+    required = names[:len(names) - len(spec.defaults or ())]
+    for name in params:
+        if name not in names:
+            raise ValueError('unknown argument: %s' % name)
+    for name in required:
+        if name not in params:
+            raise ValueError('missing argument: %s' % name)
+    for name, value in params.items():
+        kind = ARGUMENT_TYPES.get(name)
+        if value is None and name not in required:
+            continue
+        if kind == 'names' and not (isinstance(value, list) and
+                                    all(isinstance(item, string_types) for item in value)):
+            raise ValueError('%s must be a list of strings' % name)
+        if kind == 'name' and not isinstance(value, string_types):
+            raise ValueError('%s must be a string' % name)
+        if kind == 'flag' and not isinstance(value, bool):
+            raise ValueError('%s must be true or false' % name)
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """
+        JSON over HTTP interface of a TinpService, every action is a POST to
+        /<action> with its keyword arguments as a json object and answers
+        {"result": ...} or {"error": message}
+    """
+
+    def _send(self, code, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.strip('/') != 'status':
+            return self._send(404, {'error': 'unknown action'})
+        self._send(200, {'result': self.server.service.status()})
+
+    def do_POST(self):
+        action = self.path.strip('/')
+        if action not in ACTIONS:
+            return self._send(404, {'error': 'unknown action'})
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            params = json.loads(self.rfile.read(length).decode('utf-8')) if length else {}
+            if not isinstance(params, dict):
+                raise ValueError('the arguments must be a json object')
+            function = getattr(self.server.service, action)
+            check_arguments(function, params)
+        except ValueError as e:
+            return self._send(400, {'error': str(e)})
+        try:
+            result = function(**params)
+        except Exception as e:
+            traceback.print_exc()
+            return self._send(500, {'error': str(e)})
+        self._send(200, {'result': result})
+
+
+class ServiceServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service):
+        HTTPServer.__init__(self, address, ServiceHandler)
+        self.service = service
+
+
+def parse_address(address):
+    """
+    Parse a "[host:]port" listening address
+    :return: (host, port) tuple
+    """
+    host, _, port = address.rpartition(':')
+    return host or DEFAULT_ADDRESS[0], int(port)
+
+
+def serve(service, address=DEFAULT_ADDRESS):
+    """
+    Answer the requests of a loaded TinpService until interrupted
+    :param address: (host, port) tuple
+    """
+    service.start()
+    server = ServiceServer(address, service)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        server.server_close()
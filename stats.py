@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# stats.py
+#
+# Copyright 2014 Carlos Cesar Caballero Diaz <ccesar@linuxmail.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+__author__ = 'cccaballero'
+
+import time
+import threading
+from contextlib import contextmanager
+
+# Process wide counters and timers. Hot loops should add their totals once
+# (a whole index, a whole download) instead of once per item
+_lock = threading.Lock()
+_counters = {}
+_timers = {}
+
+
+def count(name, value=1):
+    """
+    Add to a counter
+    :param name: counter name (ex: "download.bytes")
+    :param value: amount to add
+    """
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def add_time(name, seconds):
+    """
+    Add a measured time to a timer
+    """
+    with _lock:
+        total, calls = _timers.get(name, (0.0, 0))
+        _timers[name] = (total + seconds, calls + 1)
+
+
+@contextmanager
+def timer(name):
+    """
+    Time a block of code, times of blocks run by several threads at once are added up
+    """
+    start = time.time()
+    try:
+        yield
+    finally:
+        add_time(name, time.time() - start)
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _timers.clear()
+
+
+def snapshot():
+    """
+    Return the counters and timers
+    :return: dictionary with "counters" (name and value) and "timers"
+        (name and {"seconds", "calls"}) dictionaries
+    """
+    with _lock:
+        return {'counters': dict(_counters),
+                'timers': dict((name, {'seconds': round(total, 6), 'calls': calls})
+                               for name, (total, calls) in _timers.items())}
+
+
+def summary(data=None):
+    """
+    Return a text summary of the counters and timers, with rates derived
+    from them (stanzas parsed per second, download throughput)
+    """
+    data = data or snapshot()
+    counters = data['counters']
+    timers = data['timers']
+    lines = []
+    for name in sorted(timers):
+        lines.append('%-28s %10.3fs %8d calls' % (name, timers[name]['seconds'], timers[name]['calls']))
+    for name in sorted(counters):
+        lines.append('%-28s %12d' % (name, counters[name]))
+    parse_time = timers.get('index.parse', {}).get('seconds')
+    if parse_time and counters.get('index.stanzas'):
+        lines.append('%-28s %12d' % ('index.stanzas_per_second', counters['index.stanzas'] / parse_time))
+    download_time = timers.get('download', {}).get('seconds')
+    if download_time and counters.get('download.bytes'):
+        lines.append('%-28s %12d' % ('download.bytes_per_second', counters['download.bytes'] / download_time))
+    return '\n'.join(lines)
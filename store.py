@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# store.py
+#
+# Copyright 2014 Carlos Cesar Caballero Diaz <ccesar@linuxmail.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+__author__ = 'cccaballero'
+
+import os
+import sys
+import json
+import mmap
+import struct
+import binascii
+import tempfile
+from array import array
+if sys.version >= '3':
+    from sys import intern
+
+STORE_MAGIC = b'TINPSTORE\x01'
+
+# relations kept pre-parsed in the store, the rest are parsed on demand
+STORED_RELATIONS = ('depends', 'pre-depends', 'recommends', 'suggests', 'provides')
+
+_INT_COLUMNS = ('name', 'version', 'filename', 'section', 'length', 'relation_index', 'relation_data')
+_LONG_COLUMNS = ('size', 'offset')
+_BYTES_COLUMNS = ('sha256', 'stanzas', 'strings')
+
+_NO_SHA256 = b'\0' * 32
+
+
+class InvalidStore(Exception):
+    """
+        A package store file is invalid or was written by another version
+    """
+    pass
+
+
+class PackageStore(object):
+
+    def __init__(self, base_url=None):
+        """
+        Column oriented storage for the stanzas of a packages index. Names,
+        versions, filenames and sections are interned strings ids, sizes and
+        hashes are packed arrays, relations are stored as lists of string
+        ids and the complete stanza text is kept in a single blob for the
+        remaining fields and for dumping
+        :param base_url: url of the repository the packages come from
+        """
+        self.base_url = base_url
+        self.strings = []
+        self.string_ids = {}
+        self.name = array('i')
+        self.version = array('i')
+        self.filename = array('i')
+        self.section = array('i')
+        self.size = array('q')
+        self.offset = array('q')
+        self.length = array('i')
+        self.sha256 = bytearray()
+        self.stanzas = bytearray()
+        # relation_index[i * len(STORED_RELATIONS) + k] is where relation k
+        # of package i starts in relation_data, alternatives groups end with -1
+        self.relation_index = array('i', [0])
+        self.relation_data = array('i')
+
+    def __len__(self):
+        return len(self.name)
+
+    def intern(self, string):
+        """
+        Return the id of a string, adding it to the strings table if needed
+        """
+        string_id = self.string_ids.get(string)
+        if string_id is None:
+            string_id = self.string_ids[string] = len(self.strings)
+            self.strings.append(intern(string))
+        return string_id
+
+    def _optional(self, fields, field):
+        return self.intern(fields[field]) if field in fields else -1
+
+    def append(self, fields, stanza, relations):
+        """
+        Add a package to the store
+        :param fields: dictionary of stanza fields
+        :param stanza: stanza text
+        :param relations: dictionary of relation kind and list of
+            alternative groups, each one a list of package names
+        """
+        stanza = stanza.encode('utf-8')
+        offset = len(self.stanzas)
+        self.stanzas.extend(stanza)
+        self.append_span(fields, offset, len(stanza), relations)
+
+    def append_span(self, fields, offset, length, relations):
+        """
+        Add a package whose stanza text is already in the stanzas blob
+        :param offset: stanza position in the blob
+        :param length: stanza length in bytes
+        """
+        self.name.append(self.intern(fields['Package']))
+        self.version.append(self.intern(fields['Version']))
+        self.filename.append(self._optional(fields, 'Filename'))
+        self.section.append(self._optional(fields, 'Section'))
+        self.size.append(int(fields['Size']) if 'Size' in fields else -1)
+        self.sha256.extend(binascii.unhexlify(fields['SHA256']) if 'SHA256' in fields else _NO_SHA256)
+        self.offset.append(offset)
+        self.length.append(length)
+        for kind in STORED_RELATIONS:
+            for group in relations.get(kind, ()):
+                for name in group:
+                    self.relation_data.append(self.intern(name))
+                self.relation_data.append(-1)
+            self.relation_index.append(len(self.relation_data))
+
+    def record(self, index):
+        return PackageRecord(self, index)
+
+    def records(self):
+        for index in range(len(self.name)):
+            yield PackageRecord(self, index)
+
+    def package_name(self, index):
+        return self.strings[self.name[index]]
+
+    def package_version(self, index):
+        return self.strings[self.version[index]]
+
+    def stanza(self, index):
+        offset = self.offset[index]
+        return bytes(self.stanzas[offset:offset + self.length[index]])
+
+    def relation(self, index, kind):
+        """
+        Return a stored relation of a package
+        :return: list of alternative groups, each one a list of package names
+        """
+        position = index * len(STORED_RELATIONS) + STORED_RELATIONS.index(kind)
+        groups = []
+        group = []
+        for string_id in self.relation_data[self.relation_index[position]:self.relation_index[position + 1]]:
+            if string_id < 0:
+                groups.append(group)
+                group = []
+            else:
+                group.append(self.strings[string_id])
+        return groups
+
+    def _serialize(self):
+        """
+        Return the binary form of the store as a list of chunks
+        """
+        columns = {}
+        chunks = []
+        position = 0
+        for column in _INT_COLUMNS + _LONG_COLUMNS + _BYTES_COLUMNS:
+            if column == 'strings':
+                data = '\0'.join(self.strings).encode('utf-8')
+                typecode = 'B'
+            elif column in _BYTES_COLUMNS:
+                data = bytes(getattr(self, column))
+                typecode = 'B'
+            else:
+                values = getattr(self, column)
+                data = values.tobytes() if isinstance(values, array) else bytes(values)
+                typecode = values.typecode if isinstance(values, array) else values.format
+            columns[column] = [position, len(data), typecode]
+            padding = -len(data) % 8
+            chunks.append(data + b'\0' * padding)
+            position += len(data) + padding
+        header = json.dumps({'base_url': self.base_url, 'count': len(self),
+                             'strings': len(self.strings), 'columns': columns}).encode('utf-8')
+        header += b' ' * (-(len(STORE_MAGIC) + 4 + len(header)) % 8)
+        return [STORE_MAGIC, struct.pack('<I', len(header)), header] + chunks
+
+    def dumps(self):
+        return b''.join(self._serialize())
+
+    def __reduce__(self):
+        return (_store_from_bytes, (self.dumps(),))
+
+    def save(self, path):
+        """
+        Write the store to a file that can be loaded with memory mapping
+        """
+        fd, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                                              prefix='.%s.' % os.path.basename(path), suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in self._serialize():
+                    f.write(chunk)
+            os.rename(temporary_path, path)
+        except:
+            os.remove(temporary_path)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a store written by save, columns are memory mapped and only the
+        strings table is decoded
+        """
+        f = open(path, 'rb')
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            f.close()
+        return cls.loads(data, path)
+
+    @classmethod
+    def loads(cls, data, name='<bytes>'):
+        """
+        Load a store from its binary form (bytes or mmap) without copying the columns
+        """
+        if data[:len(STORE_MAGIC)] != STORE_MAGIC:
+            raise InvalidStore("Not a package store: %s" % name)
+        header_length = struct.unpack('<I', data[len(STORE_MAGIC):len(STORE_MAGIC) + 4])[0]
+        start = len(STORE_MAGIC) + 4
+        header = json.loads(data[start:start + header_length].decode('utf-8'))
+        start += header_length
+        view = memoryview(data)
+        store = cls(header['base_url'])
+        for column, (offset, length, typecode) in header['columns'].items():
+            values = view[start + offset:start + offset + length]
+            if column == 'strings':
+                strings = bytes(values).decode('utf-8').split('\0') if header['strings'] else []
+                store.strings = [intern(string) for string in strings]
+            elif typecode != 'B':
+                setattr(store, column, values.cast(typecode))
+            else:
+                setattr(store, column, values)
+        store.string_ids = None
+        return store
+
+
+def _store_from_bytes(data):
+    return PackageStore.loads(data)
+
+
+class _Relations(object):
+    """
+        Mapping of relation kind to parsed relations of a PackageRecord,
+        compatible with deb822.Packages.relations
+    """
+
+    __slots__ = ('record',)
+
+    def __init__(self, record):
+        self.record = record
+
+    def __getitem__(self, kind):
+        if kind in STORED_RELATIONS:
+            return [[{'name': name} for name in group]
+                    for group in self.record.store.relation(self.record.index, kind)]
+        from debian import deb822
+        field = '-'.join(part.capitalize() for part in kind.split('-'))
+        value = self.record.get(field)
+        return deb822.PkgRelation.parse_relations(value) if value else []
+
+
+class PackageRecord(object):
+    """
+        View of a package stored in a PackageStore, offering the
+        deb822.Packages interface used by tinP
+    """
+
+    __slots__ = ('store', 'index')
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    @property
+    def base_url(self):
+        return self.store.base_url
+
+    @property
+    def relations(self):
+        return _Relations(self)
+
+    def fields(self):
+        """
+        Return all the stanza fields, parsed from the stanza text
+        """
+        from parsers import PackageStanza
+        return PackageStanza.from_text(self.store.stanza(self.index).decode('utf-8'))
+
+    def __getitem__(self, field):
+        store = self.store
+        index = self.index
+        if field == 'Package':
+            return store.strings[store.name[index]]
+        if field == 'Version':
+            return store.strings[store.version[index]]
+        if field in ('Filename', 'Section'):
+            string_id = (store.filename if field == 'Filename' else store.section)[index]
+            if string_id < 0:
+                raise KeyError(field)
+            return store.strings[string_id]
+        if field == 'Size':
+            if store.size[index] < 0:
+                raise KeyError(field)
+            return str(store.size[index])
+        if field == 'SHA256':
+            sha256 = bytes(store.sha256[index * 32:index * 32 + 32])
+            if sha256 == _NO_SHA256:
+                raise KeyError(field)
+            return binascii.hexlify(sha256).decode('ascii')
+        return self.fields()[field]
+
+    def get(self, field, default=None):
+        try:
+            return self[field]
+        except KeyError:
+            return default
+
+    def __contains__(self, field):
+        return self.get(field) is not None
+
+    def keys(self):
+        return self.fields().keys()
+
+    def items(self):
+        return self.fields().items()
+
+    def dump(self, fd=None, encoding='utf-8', text_mode=False):
+        """
+        Dump the stanza in the Packages file format
+        :param fd: file object to write to, the stanza text is returned if None
+        :param text_mode: fd is a text file
+        """
+        stanza = self.store.stanza(self.index)
+        if fd is None:
+            return stanza.decode('utf-8')
+        fd.write(stanza.decode('utf-8') if text_mode else stanza)
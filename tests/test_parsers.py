@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# test_parsers.py
+#
+# Copyright 2014 Carlos Cesar Caballero Diaz <ccesar@linuxmail.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+
+__author__ = 'cccaballero'
+
+import pytest
+from parsers import parse_packages_data, scan_stanza, iter_stanza_spans, FAST_FIELDS
+from resolver import relation_names
+from store import STORED_RELATIONS
+
+INDEX = b'''Package: libfoo1
+Source: foo (1.2-3)
+Version: 1:1.2-3~bpo1
+Architecture: amd64
+Multi-Arch: same
+Pre-Depends: multiarch-support
+Depends: libc6 (>= 2.14), libbar2 | libbar1 (<< 2),
+ libbaz0 [amd64], zlib1g:any
+Recommends: foo-data (= 1:1.2-3~bpo1)
+Suggests: foo-doc <!nodoc>
+Provides: libfoo (= 1.2), foo-abi-1
+Section: libs
+Size: 12345
+Filename: pool/main/f/foo/libfoo1_1.2-3~bpo1_amd64.deb
+SHA256: 2c26b46b68ffc68ff99b453c1d30413413422d706483bfa0f98a5e886266e7ae
+Description: foo library
+ A long description, with a: colon
+ .
+ Depends: not a field
+
+package: lowercase
+version: 0.1
+depends: libfoo1
+filename: pool/main/l/lowercase/lowercase_0.1_all.deb
+size: 1
+Description: field names are case insensitive
+
+Package: bare
+Version: 2
+Filename: pool/main/b/bare/bare_2_all.deb
+Size: 2
+'''
+
+
+def records(parser):
+    store = parse_packages_data(INDEX, 'file:/repo', parser=parser)
+    return [store.record(index) for index in range(len(store))]
+
+
+def test_stanza_spans():
+    stanzas = [INDEX[start:end] for start, end in iter_stanza_spans(INDEX)]
+    assert len(stanzas) == 3
+    assert stanzas[0].startswith(b'Package: libfoo1\n')
+    assert stanzas[-1].endswith(b'Size: 2\n')
+
+
+@pytest.mark.parametrize('field', FAST_FIELDS)
+def test_fields_match_deb822(field):
+    for fast, deb822 in zip(records('fast'), records('deb822')):
+        assert fast.get(field) == deb822.get(field)
+
+
+@pytest.mark.parametrize('kind', STORED_RELATIONS)
+def test_relations_match_deb822(kind):
+    for fast, deb822 in zip(records('fast'), records('deb822')):
+        assert relation_names(fast, kind) == relation_names(deb822, kind)
+
+
+def test_scan_stanza():
+    start, end = next(iter_stanza_spans(INDEX))
+    fields, relations = scan_stanza(INDEX, start, end)
+    assert fields['Version'] == '1:1.2-3~bpo1'
+    # the "Depends:" line of the long description is not a field
+    assert relations['depends'] == [['libc6'], ['libbar2', 'libbar1'], ['libbaz0'], ['zlib1g']]
+    assert relations['pre-depends'] == [['multiarch-support']]
+    assert relations['provides'] == [['libfoo'], ['foo-abi-1']]
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# test_repository.py
+#
+# Copyright 2014 Carlos Cesar Caballero Diaz <ccesar@linuxmail.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+
+__author__ = 'cccaballero'
+
+import gzip
+import os
+from repository import TinpRepository
+
+# unusual but valid formatting the rebuild must not normalize
+STANZAS = [b'''Package: first
+Version: 1.0-1
+Filename: pool/main/f/first/first_1.0-1_amd64.deb
+Size: 10
+X-Custom-Field:  two  spaces
+Description: first package
+ long description
+ .
+ second paragraph
+''', b'''Package: removed
+Version: 2
+Filename: pool/main/r/removed/removed_2_amd64.deb
+Size: 20
+Description: removed package
+''', b'''package: last
+Size: 30
+Version: 3
+Filename: pool/main/l/last/last_3_all.deb
+Depends: first (>= 1.0),
+  removed
+Description: last package
+''']
+
+
+def index(stanzas):
+    # tinP ends every stanza of its index, the last one too, with a blank line
+    return b''.join(stanza + b'\n' for stanza in stanzas)
+
+
+def make_repository(path):
+    index_dir = os.path.join(path, 'dists', 'tinp', 'main', 'binary-amd64')
+    os.makedirs(index_dir)
+    with open(os.path.join(index_dir, 'Packages'), 'wb') as f:
+        f.write(index(STANZAS))
+    return index_dir
+
+
+def test_rebuild_after_remove_keeps_stanzas(tmpdir):
+    path = str(tmpdir)
+    index_dir = make_repository(path)
+    tinp = TinpRepository(path, arch='binary-amd64')
+    assert sorted(tinp.packages) == ['first', 'last', 'removed']
+    tinp.remove_package('removed')
+    tinp.rebuild_repo_index()
+    with open(os.path.join(index_dir, 'Packages'), 'rb') as f:
+        data = f.read()
+    assert data == index([STANZAS[0], STANZAS[2]])
+    with gzip.open(os.path.join(index_dir, 'Packages.gz'), 'rb') as f:
+        assert f.read() == data
+    assert sorted(TinpRepository(path, arch='binary-amd64').packages) == ['first', 'last']
+
+
+def test_unchanged_rebuild_keeps_index(tmpdir):
+    path = str(tmpdir)
+    index_dir = make_repository(path)
+    tinp = TinpRepository(path, arch='binary-amd64')
+    tinp.changed = True
+    tinp.rebuild_repo_index()
+    with open(os.path.join(index_dir, 'Packages'), 'rb') as f:
+        assert f.read() == index(STANZAS)
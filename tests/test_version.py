@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# test_version.py
+#
+# Copyright 2014 Carlos Cesar Caballero Diaz <ccesar@linuxmail.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+
+__author__ = 'cccaballero'
+
+import pytest
+from version import version_key, compare_versions, is_newer
+
+# ascending, every version sorts before the next one with dpkg --compare-versions
+ORDERED = ['1.0~~', '1.0~~a', '1.0~', '1.0~rc1', '1.0', '1.0-0.1', '1.0-1~bpo1', '1.0-1', '1.0-1.1', '1.0-2',
+           '1.0-10', '1.0a', '1.0+b1', '1.0-beta-1', '1.0.1', '1.0.9', '1.0.10', '1.1', '9.9', '1:0.1', '1:0.1-1',
+           '2:0']
+
+
+@pytest.mark.parametrize('older, newer', list(zip(ORDERED, ORDERED[1:])))
+def test_dpkg_order(older, newer):
+    assert version_key(older) < version_key(newer)
+    assert compare_versions(older, newer) < 0
+    assert compare_versions(newer, older) > 0
+    assert is_newer(newer, older)
+    assert not is_newer(older, newer)
+
+
+def test_sort():
+    assert sorted(reversed(ORDERED), key=version_key) == ORDERED
+
+
+@pytest.mark.parametrize('version_a, version_b', [('1.0', '1.0-0'), ('0:1.0', '1.0'), ('1.0a', '1.0a-0')])
+def test_equal_versions(version_a, version_b):
+    assert version_key(version_a) == version_key(version_b)
+    assert compare_versions(version_a, version_b) == 0
+    assert not is_newer(version_a, version_b)
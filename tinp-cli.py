@@ -23,140 +23,546 @@
 from __future__ import absolute_import, print_function
 import sys
 import os
+import copy
+import argparse
 
-import spia.internationalizator as internationalizator
-from spia.internationalizator import _
-if sys.version < '3':
-    from urllib import quote
-else:
-    from urllib.parse import quote
-
+# Only what parsing the arguments needs is imported here, handlers import
+# the modules they use and the locale tables are loaded by the first
+# translated message, so cheap commands start at once
 
 LOCALE_DIR = os.path.join(sys.path[0], "locale")
-internationalizator.load_locale_chains(LOCALE_DIR)
+_internationalizator = None
+
+
+def get_internationalizator():
+    """
+        Return the internationalizator, loading the locale tables on first use
+    """
+    global _internationalizator
+    if _internationalizator is None:
+        import spia.internationalizator as internationalizator
+        internationalizator.load_locale_chains(LOCALE_DIR)
+        _internationalizator = internationalizator
+    return _internationalizator
+
+def _(s):
+    return get_internationalizator()._(s)
+
+class Deferred(str):
+    """
+        String translated when it is shown, see HelpFormatter
+    """
+    pass
+
+def N_(s):
+    """
+        Mark a string for translation, it is translated when it is shown
+    """
+    return Deferred(s)
+
+def translate(s):
+    return _(s) if isinstance(s, Deferred) else s
+
+def quote_path(path):
+    if sys.version < '3':
+        from urllib import quote
+    else:
+        from urllib.parse import quote
+    return quote(path, safe="%/:=&?~#+!$,;'@()*[]")
+
+
+def get_pool(pool_dir):
+    """
+        Return the shared package pool, None if not used
+    """
+    from pool import PackagePool
+
+    if not pool_dir:
+        return None
+    return PackagePool(pool_dir)
+
+def get_cache(cache_dir, max_age=0):
+    """
+        Return the packages index cache, None if disabled
+    """
+    from cache import IndexCache
+
+    if cache_dir is False:
+        return None
+    return IndexCache(cache_dir, max_age)
+
+def get_scheduler(jobs, per_host, retries, limit_rate):
+    """
+        Return the download scheduler of the package files
+    """
+    from scheduler import DownloadScheduler, parse_rate
+
+    return DownloadScheduler(workers=jobs, per_host=per_host, retries=retries,
+                             rate=parse_rate(limit_rate) if limit_rate else None)
+
+def get_tinps(repo_path, archs, pool_dir, verify=False, scheduler=None):
+    """
+        Return a tinP repository object for every architecture
+    """
+    from repository import TinpRepository
+
+    pool = get_pool(pool_dir)
+    return [TinpRepository(repo_path, arch=arch, pool=pool, verify=verify, scheduler=scheduler) for arch in archs]
+
+def apply_or_exit(tinps, jobs):
+    """
+        apply the begun transactions, when files could not be downloaded
+        the user is told how to continue the transaction and tinP exits
+    """
+    from repository import apply_transactions, DownloadError
 
+    try:
+        apply_transactions(tinps, workers=jobs)
+    except DownloadError as e:
+        print (_('Error: %s') % e)
+        print (_('The transaction was kept, run tinP again with --resume to continue it'))
+        sys.exit(1)
 
-def add(repo_path, package_names, sources, recommends, suggests, arch):
+def add(repo_path, package_names, sources, recommends, suggests, archs, jobs, cache_dir, pool_dir, verify, scheduler):
     """
         add package option handler
     """
     from parsers import get_repositories
-    from repository import SourceRepository, TinpRepository
-    from parsers import get_repositories
-    from utils import join_dicts
+    from repository import load_source_repositories
 
     repos = get_repositories(sources)
-    rep = SourceRepository(repos, arch=arch)
     print (_("Loading packages..."))
-    rep.load_packages()
-    print (_("Finding dependencies..."))
-    packages = {}
-    for package in package_names.split(' '):
-        packages = join_dicts(packages, 
-            rep.get_package_tree(package, recommends=recommends, suggests=suggests))
+    reps = load_source_repositories(repos, archs, cache=get_cache(cache_dir), workers=jobs)
     print (_("Loading repository..."))
-    tinp = TinpRepository(repo_path, arch=arch)
+    tinps = get_tinps(repo_path, archs, pool_dir, verify, scheduler)
+    print (_("Finding dependencies..."))
+    for rep, tinp in zip(reps, tinps):
+        packages = rep.get_packages_tree(package_names.split(' '), recommends=recommends, suggests=suggests)
+        begin_transaction(tinp, 'add', packages.values(), package_names.split(' '), recommends, suggests,
+                          rep.get_mirrors(packages.values()))
     print (_("Adding new packages..."))
-    for p in packages:
-        tinp.add_package(packages[p])
-    print (_("Building package index..."))
-    tinp.rebuild_repo_index()
+    apply_or_exit(tinps, jobs)
+    print_unresolved(tinps)
     print ("----------------------------------------")
     print (_('Completed. You can use the repository adding next line to your "sources.list":'))
-    print ('    deb file:%s tinp main' % quote(repo_path, safe="%/:=&?~#+!$,;'@()*[]"))
+    print ('    deb file:%s tinp main' % quote_path(repo_path))
 
-def add_section(repo_path, section_name, sources, recommends, suggests, arch):
+def add_section(repo_path, section_names, sources, recommends, suggests, archs, jobs, cache_dir, pool_dir, verify,
+                scheduler):
     """
-        add_section option handler
+        add_section option handler, the packages of all the sections are
+        resolved, downloaded and indexed as a single batch
     """
     from parsers import get_repositories
-    from repository import SourceRepository, TinpRepository
-    from parsers import get_repositories
-    from utils import join_dicts
+    from repository import load_source_repositories
     repos = get_repositories(sources)
-    rep = SourceRepository(repos, arch=arch)
+    patterns = section_names.split()
     print (_("Loading packages..."))
-    rep.load_packages()
+    reps = load_source_repositories(repos, archs, cache=get_cache(cache_dir), workers=jobs)
+    tinps = get_tinps(repo_path, archs, pool_dir, verify, scheduler)
     print (_("Finding dependencies..."))
-    packages = {}
-    for package_name in rep.packages:
-        if rep.packages[package_name]['Section'] == section_name:
-            packages = join_dicts(packages, 
-                rep.get_package_tree(package_name, recommends=recommends, suggests=suggests))
-    tinp = TinpRepository(repo_path, arch=arch)
+    for rep, tinp in zip(reps, tinps):
+        index = rep.get_index()
+        for pattern in patterns:
+            if not index.matching_sections([pattern]):
+                print (_('No section matches %s') % pattern)
+        roots = index.section_roots(patterns)
+        packages = rep.get_packages_tree(roots, recommends=recommends, suggests=suggests)
+        begin_transaction(tinp, 'add_section', packages.values(), roots, recommends, suggests,
+                          rep.get_mirrors(packages.values()))
     print (_("Adding new packages..."))
-    for p in packages:
-        tinp.add_package(packages[p])
-    print (_("Building package index..."))
-    tinp.rebuild_repo_index()
+    apply_or_exit(tinps, jobs)
+    print_unresolved(tinps)
     print ("----------------------------------------")
     print (_('Completed. You can use the repository adding next line to your "sources.list":'))
-    print ('    deb [trusted=yes] file:%s tinp main' % quote(repo_path, safe="%/:=&?~#+!$,;'@()*[]"))
+    print ('    deb [trusted=yes] file:%s tinp main' % quote_path(repo_path))
+
+
+def print_plan(plan):
+    """
+        print an upgrade plan summary
+    """
+    from contrib.unwrapt.utils import format_number
 
+    for name, old, new in plan['upgraded']:
+        print ('    %s %s -> %s' % (name, old, new))
+    for name, version in plan['added']:
+        print ('    %s %s (%s)' % (name, version, _('new')))
+    for name in plan['not_found']:
+        print ('    %s (%s)' % (name, _('not found in the origin repositories, kept')))
+    print (_('%d to upgrade, %d new, %d not found') % (len(plan['upgraded']), len(plan['added']),
+                                                      len(plan['not_found'])))
+    print (_('%sB to download') % format_number(plan['download_size']))
 
-def upgrade(repo_path, sources, arch):
+def upgrade(repo_path, sources, archs, jobs, cache_dir, pool_dir, verify, dry_run, scheduler):
     """
         upgrade package option handler
     """
     from parsers import get_repositories
-    from repository import SourceRepository, TinpRepository
+    from repository import load_source_repositories
+    from planner import plan_upgrade
 
     repos = get_repositories(sources)
-    rep = SourceRepository(repos, arch=arch)
     print (_("Loading packages..."))
-    rep.load_packages()
-    tinp = TinpRepository(repo_path, arch=arch)
+    reps = load_source_repositories(repos, archs, cache=get_cache(cache_dir), workers=jobs)
+    tinps = get_tinps(repo_path, archs, pool_dir, verify, scheduler)
+    plans = []
+    for rep, tinp in zip(reps, tinps):
+        plan = plan_upgrade(tinp, rep)
+        if len(archs) > 1:
+            print ('%s:' % tinp.arch)
+        print_plan(plan.summary(tinp))
+        plans.append(plan)
+    if dry_run:
+        return
+    for rep, tinp, plan in zip(reps, tinps, plans):
+        begin_transaction(tinp, 'upgrade', plan.packages(), mirrors=rep.get_mirrors(plan.packages()))
     print (_("Updating packages..."))
-    for p in tinp.packages:
-        tinp.add_package(rep.packages[p])
-    print (_("Building package index..."))
-    tinp.rebuild_repo_index()
+    apply_or_exit(tinps, jobs)
 
 
-def remove(repo_path, package_names, arch):
+def print_search(results):
     """
-        remove package option handler
+        print the packages found by a search
     """
-    from repository import TinpRepository
+    for name, version, section, description in results:
+        print ('    %s %s - %s' % (name, version, description))
+    print (_('%d packages found') % len(results))
+
+def print_closure(summary):
+    """
+        print the packages adding a group of packages would bring in
+    """
+    from contrib.unwrapt.utils import format_number
+
+    for name, version, size, fetched in summary['packages']:
+        if fetched:
+            print ('    %s %s %sB (%s)' % (name, version, format_number(size), _('present')))
+        else:
+            print ('    %s %s %sB' % (name, version, format_number(size)))
+    for name in summary['not_found']:
+        print ('    %s (%s)' % (name, _('not found')))
+    print (_('%d packages, %sB in total, %sB to download') % (len(summary['packages']),
+                                                             format_number(summary['total_size']),
+                                                             format_number(summary['download_size'])))
 
+def print_why(package_name, chain):
+    """
+        print the dependency chain explaining why a package is needed
+    """
+    if chain is None:
+        print ('    ' + _('%s is not needed') % package_name)
+    else:
+        print ('    ' + ' -> '.join(chain))
+
+def query(repo_path, sources, archs, jobs, cache_dir, pool_dir, max_age, search_terms, package_names, why_name,
+          recommends, suggests):
+    """
+        search, query and why options handler, the origin indexes checked
+        less than max_age seconds ago are used without contacting the mirrors
+    """
+    from parsers import get_repositories
+    from repository import load_source_repositories
+    from search import search_summary, closure_summary, why_summary
+
+    repos = get_repositories(sources)
+    print (_("Loading packages..."))
+    reps = load_source_repositories(repos, archs, cache=get_cache(cache_dir, max_age), workers=jobs)
+    tinps = get_tinps(repo_path, archs, pool_dir)
+    roots = package_names.split(' ') if package_names else None
+    for rep, tinp in zip(reps, tinps):
+        if len(archs) > 1:
+            print ('%s:' % rep.arch)
+        if search_terms:
+            print_search(search_summary(rep, search_terms.split(' ')))
+        if package_names:
+            print_closure(closure_summary(rep, tinp, roots, recommends, suggests))
+        if why_name:
+            print_why(why_name, why_summary(rep, tinp, why_name, roots, recommends, suggests))
+
+
+def print_unresolved(tinps):
+    """
+        warn about requested packages that could not be recorded as explicitly added
+    """
+    for tinp in tinps:
+        for name in tinp.unresolved_roots:
+            print (_('Warning: %s (%s) was not found, it is not recorded as an explicitly added package') %
+                   (name, tinp.arch))
+
+
+def begin_transaction(tinp, action, packages, roots=(), recommends=False, suggests=False, mirrors=None):
+    """
+        journal the packages of an action before fetching them
+    """
+    if tinp.journal.exists():
+        print (_("Discarding an unfinished transaction, use --resume to continue it instead"))
+    tinp.begin_transaction(action, packages, roots, recommends, suggests, mirrors)
+
+
+def resume(repo_path, archs, jobs, pool_dir, verify, scheduler):
+    """
+        resume option handler
+    """
     print (_("Loading repository..."))
-    tinp = TinpRepository(repo_path, arch=arch)
+    tinps = [tinp for tinp in get_tinps(repo_path, archs, pool_dir, verify, scheduler) if tinp.journal.exists()]
+    if not tinps:
+        print (_("There is no unfinished transaction"))
+        return
+    print (_("Resuming the unfinished transaction..."))
+    apply_or_exit(tinps, jobs)
+    print_unresolved(tinps)
+    print (_('Completed'))
+
+
+def remove(repo_path, package_names, archs, pool_dir):
+    """
+        remove package option handler
+    """
+    print (_("Loading repository..."))
+    tinps = get_tinps(repo_path, archs, pool_dir)
     print (_("removing package(s)..."))
-    for package in package_names.split(' '):
-        tinp.remove_package(package)
+    for tinp in tinps:
+        manifest = tinp.get_manifest()
+        for package in package_names.split(' '):
+            manifest.discard(package)
+            if package in tinp.packages:
+                tinp.remove_package(package)
+    collect_garbage(tinps)
+
+def garbage_collect(repo_path, archs, pool_dir):
+    """
+        gc option handler
+    """
+    print (_("Loading repository..."))
+    collect_garbage(get_tinps(repo_path, archs, pool_dir))
+
+def collect_garbage(tinps):
+    """
+        remove the packages no root package needs and rebuild the indexes
+    """
+    from repository import write_tinp_release
+
+    print (_("Removing unused packages..."))
+    for tinp in tinps:
+        for package in tinp.collect_garbage():
+            print ('    %s' % package)
     print (_("Building package index..."))
-    tinp.rebuild_repo_index()
+    for tinp in tinps:
+        tinp.rebuild_repo_index(release=False)
+    write_tinp_release(tinps)
+    if tinps[0].pool is not None:
+        tinps[0].pool.prune()
+    print (_('Completed'))
+
+def serve(repo_path, sources, archs, jobs, cache_dir, pool_dir, verify, scheduler, address, refresh):
+    """
+        serve option handler
+    """
+    from parsers import get_repositories
+    from service import TinpService, serve as serve_requests, parse_address
+
+    host, port = parse_address(address)
+    service = TinpService(repo_path, get_repositories(sources), archs, cache_dir, jobs, get_pool(pool_dir), verify,
+                          scheduler, refresh)
+    print (_("Loading packages..."))
+    service.load()
+    print (_("Serving the repository on http://%s:%d") % (host, port))
+    serve_requests(service, (host, port))
+
+def print_changes(changes):
+    """
+        print the packages a service request added, upgraded and removed
+    """
+    for arch in sorted(changes):
+        change = changes[arch]
+        if len(changes) > 1:
+            print ('%s:' % arch)
+        for name, old, new in change['upgraded']:
+            print ('    %s %s -> %s' % (name, old, new))
+        for name in change['added']:
+            print ('    %s (%s)' % (name, _('new')))
+        for name in change['removed']:
+            print ('    %s (%s)' % (name, _('removed')))
+        for name in change.get('not_found', ()):
+            print ('    %s (%s)' % (name, _('not found')))
+        print (_('%d added, %d upgraded, %d removed') % (len(change['added']), len(change['upgraded']),
+                                                        len(change['removed'])))
+
+def remote(url, options):
+    """
+        send the requested actions to a running service
+    """
+    from client import ServiceClient, ServiceError
+
+    client = ServiceClient(url)
+    try:
+        if options.resume:
+            print_changes(client.request('resume'))
+        if options.add:
+            print_changes(client.request('add', packages=options.add.split(' '),
+                                         recommends=options.add_recommends, suggests=options.add_suggests))
+        if options.add_section:
+            print_changes(client.request('add_section', sections=options.add_section.split(),
+                                         recommends=options.add_recommends, suggests=options.add_suggests))
+        if options.remove:
+            print_changes(client.request('remove', packages=options.remove.split(' ')))
+        if options.gc:
+            print_changes(client.request('gc'))
+        if options.search:
+            result = client.request('search', terms=options.search.split(' '))
+            for arch in sorted(result):
+                if len(result) > 1:
+                    print ('%s:' % arch)
+                print_search(result[arch])
+        if options.query:
+            result = client.request('query', packages=options.query.split(' '),
+                                    recommends=options.add_recommends, suggests=options.add_suggests)
+            for arch in sorted(result):
+                if len(result) > 1:
+                    print ('%s:' % arch)
+                print_closure(result[arch])
+        if options.why:
+            result = client.request('why', package=options.why,
+                                    roots=options.query.split(' ') if options.query else None,
+                                    recommends=options.add_recommends, suggests=options.add_suggests)
+            for arch in sorted(result):
+                if len(result) > 1:
+                    print ('%s:' % arch)
+                print_why(options.why, result[arch])
+        if options.upgrade:
+            result = client.request('upgrade', dry_run=options.dry_run)
+            if options.dry_run:
+                for arch in sorted(result):
+                    if len(result) > 1:
+                        print ('%s:' % arch)
+                    print_plan(result[arch])
+            else:
+                print_changes(result)
+    except ServiceError as e:
+        print (_('Service error: %s') % e)
+        sys.exit(1)
     print (_('Completed'))
 
 def define_locale(locale):
-    internationalizator.force(locale)
+    get_internationalizator().force(locale)
 
 def start(repo_path, options):
     """Run the requested actions from CLI"""
     if options.define_locale:
         define_locale(options.define_locale)
+    if options.server:
+        remote(options.server, options)
+        return
+    scheduler = None
+    if options.serve or options.resume or options.add or options.add_section or options.upgrade:
+        scheduler = get_scheduler(options.jobs, options.per_host, options.retries, options.limit_rate)
+    archs = options.arch.replace(',', ' ').split()
+    if options.serve:
+        serve(repo_path, options.sources, archs, options.jobs, options.cache_dir, options.pool, options.verify,
+            scheduler, options.serve, options.refresh)
+        return
+    if options.resume:
+        resume(repo_path, archs, options.jobs, options.pool, options.verify, scheduler)
     if options.add:
         add(repo_path, options.add, options.sources, 
-            options.add_recommends, options.add_suggests, options.arch)
+            options.add_recommends, options.add_suggests, archs, options.jobs, options.cache_dir, options.pool, options.verify,
+            scheduler)
     if options.add_section:
         add_section(repo_path, options.add_section, options.sources, 
-            options.add_recommends, options.add_suggests, options.arch)
+            options.add_recommends, options.add_suggests, archs, options.jobs, options.cache_dir, options.pool, options.verify,
+            scheduler)
     if options.remove:
-        remove(repo_path, options.remove, options.arch)
+        remove(repo_path, options.remove, archs, options.pool)
+    if options.gc:
+        garbage_collect(repo_path, archs, options.pool)
     if options.upgrade:
-        upgrade(repo_path, options.sources, options.arch)
+        upgrade(repo_path, options.sources, archs, options.jobs, options.cache_dir, options.pool, options.verify,
+            options.dry_run, scheduler)
+    if options.search or options.query or options.why:
+        query(repo_path, options.sources, archs, options.jobs, options.cache_dir, options.pool, options.max_age,
+            options.search, options.query, options.why, options.add_recommends, options.add_suggests)
+
+def run(repo_path, options):
+    """Run the requested actions, with statistics and profiling if asked"""
+    import stats
+
+    profiler = None
+    if options.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        start(repo_path, options)
+    finally:
+        if profiler is not None:
+            import pstats
+            profiler.disable()
+            profiler.dump_stats(options.profile)
+            print ("----------------------------------------")
+            pstats.Stats(profiler).sort_stats('cumulative').print_stats(25)
+        if options.stats:
+            print ("----------------------------------------")
+            print (stats.summary())
+        if options.stats_file:
+            import json
+            with open(options.stats_file, 'w') as f:
+                json.dump(stats.snapshot(), f, indent=1, sort_keys=True)
 
 lookup = {
-    'usage: ': _('Usage: '),
-    'optional arguments': _('Options'),
-    'positional arguments': _('Arguments'),
-    'too few arguments':_('too few arguments'),
-    'show this help message and exit':_('show this help message and exit')
+    'usage: ': N_('Usage: '),
+    'optional arguments': N_('Options'),
+    'options': N_('Options'),
+    'positional arguments': N_('Arguments'),
+    'too few arguments':N_('too few arguments'),
+    'show this help message and exit':N_('show this help message and exit')
     }
 
 
 def gettext(s):
-    return lookup.get(s, s)
+    """
+        argparse messages, translated once the locale tables are loaded
+        (help texts are translated by HelpFormatter when shown)
+    """
+    s = lookup.get(s, s)
+    if _internationalizator is None:
+        return s
+    return translate(s)
+
+
+class HelpFormatter(argparse.RawDescriptionHelpFormatter):
+    """
+        Translates the texts marked with N_ when the help is shown
+    """
+
+    # argparse also formats metavars to check them when arguments are added
+    formatting = False
+
+    def format_help(self):
+        self.formatting = True
+        return argparse.RawDescriptionHelpFormatter.format_help(self)
+
+    def add_usage(self, usage, actions, groups, prefix=None):
+        if prefix is None:
+            prefix = _('Usage: ')
+        argparse.RawDescriptionHelpFormatter.add_usage(self, usage, actions, groups, prefix)
+
+    def start_section(self, heading):
+        argparse.RawDescriptionHelpFormatter.start_section(self, translate(heading))
+
+    def add_text(self, text):
+        argparse.RawDescriptionHelpFormatter.add_text(self, translate(text))
+
+    def _expand_help(self, action):
+        action = copy.copy(action)
+        action.help = translate(action.help)
+        return argparse.RawDescriptionHelpFormatter._expand_help(self, action)
+
+    def _metavar_formatter(self, action, default_metavar):
+        if self.formatting:
+            action = copy.copy(action)
+            action.metavar = translate(action.metavar)
+        return argparse.RawDescriptionHelpFormatter._metavar_formatter(self, action, default_metavar)
 
 def main():
     """Main CLI program entry point"""
@@ -166,57 +572,105 @@ def main():
     # # usage = '%prog path/to/repo/ option "argument[s]"'    
     prog = 'tinp-cli'
     version = '%(prog)s 0.2.1'
-    description = _('This program creates and manage a customized debian-based repository.')
+    description = N_('This program creates and manage a customized debian-based repository.')
     epilog = version+' - (C) 2014 Carlos Cesar Caballero Díaz'
     # parser = optparse.OptionParser(usage=usage, description=description,
     #   version=version)
     # parser.set_usage('Uso: pepe')
     # parser.usage('Uso'.decode('utf-8'))
     # parser.usage = 'Uso'
-    import argparse
     argparse._ = gettext
 
     parser = argparse.ArgumentParser(
       prog=prog,
-      formatter_class=argparse.RawDescriptionHelpFormatter,
+      formatter_class=HelpFormatter,
       description=description,
       epilog=epilog)
 
-    parser.add_argument('custom_repository', metavar=_('path'),
-                   help=_('path to custom repository'))
+    parser.add_argument('custom_repository', metavar=N_('path'),
+                   help=N_('path to custom repository'))
 
     parser.add_argument('--version', action='version', version=version, 
-      help=_('show program\'s version number and exit'))
+      help=N_('show program\'s version number and exit'))
     parser.add_argument('-a', '--add', action='store', default=False, dest='add',
-      metavar=_('package[s]'), 
-      help=_('adds packages and all their dependencies to the custom repository (ex: "apache2 scite")'))
+      metavar=N_('package[s]'), 
+      help=N_('adds packages and all their dependencies to the custom repository (ex: "apache2 scite")'))
     parser.add_argument('-d', '--add-section', action='store', default=False, dest='add_section',
-      metavar=_('section[s]'), 
-      help=_('adds all packages from a section and all their dependencies to the custom repository (ex: "utils admin")'))
+      metavar=N_('section[s]'), 
+      help=N_('adds all packages from sections and all their dependencies to the custom repository, shell patterns are accepted (ex: "utils admin", "universe/python*")'))
     parser.add_argument('-c', '--arch', action='store', default='binary-amd64',
-      metavar=_('arch'), help=_('define architecture (default "binary-amd64")'))
+      metavar=N_('arch[s]'), help=N_('define architecture[s], built in a single run (ex: "binary-amd64 binary-i386", default "binary-amd64")'))
     parser.add_argument('-s', '--sources', action='store', default='/etc/apt/sources.list', 
-      metavar=_('sources_file'), 
-      help=_('origin repository source file (/etc/apt/sources.list by default)'))
+      metavar=N_('sources_file'), 
+      help=N_('origin repository source file (/etc/apt/sources.list by default)'))
+    parser.add_argument('-j', '--jobs', action='store', type=int, default=4,
+      metavar=N_('jobs'), help=N_('number of simultaneous downloads (default 4)'))
+    parser.add_argument('--per-host', action='store', type=int, default=None,
+      dest='per_host', metavar=N_('jobs'), help=N_('maximum simultaneous downloads from a single host (no limit by default)'))
+    parser.add_argument('--retries', action='store', type=int, default=3,
+      dest='retries', metavar=N_('retries'), help=N_('times every mirror of a file is tried before giving up (default 3)'))
+    parser.add_argument('--limit-rate', action='store', default=None,
+      dest='limit_rate', metavar=N_('rate'), help=N_('maximum total download speed in bytes per second (ex: "500k", "2M")'))
+    parser.add_argument('-k', '--cache-dir', action='store', default=None,
+      metavar=N_('cache_dir'), help=N_('packages index cache directory (~/.cache/tinp by default)'))
+    parser.add_argument('-n', '--no-cache', action='store_false', dest='cache_dir',
+      help=N_('always download and parse the packages indexes'))
+    parser.add_argument('-o', '--pool', action='store', default=None,
+      metavar=N_('pool_dir'), help=N_('package pool shared by several custom repositories, files are hardlinked from it'))
+    parser.add_argument('-y', '--verify', action='store_true', default=False,
+      help=N_('check the SHA256 of package files already in the repository, not only their size'))
     parser.add_argument('-e', '--add-recommends', action='store_true', default=False, 
-      help=_('add recomended packages'))
+      help=N_('add recomended packages'))
     parser.add_argument('-g', '--add-suggests', action='store_true', default=False, 
-      help=_('add sugested packages'))
+      help=N_('add sugested packages'))
     parser.add_argument('-r', '--remove', action='store', default=False,
-      dest='remove', metavar=_('package[s]'), help=_('removes packages from the repo (ex: "apache2 scite") not remove dependencies'))
+      dest='remove', metavar=N_('package[s]'), help=N_('removes packages from the repo (ex: "apache2 scite") and the dependencies no other package needs'))
+    parser.add_argument('--gc', action='store_true', default=False,
+      dest='gc', help=N_('removes the packages no explicitly added package needs'))
     parser.add_argument('-u', '--upgrade', action='store_true', default=False,
-      dest='upgrade', help=_('upgrades the repository, find new versions of the actual custom repository packages, and replace them'))
+      dest='upgrade', help=N_('upgrades the repository, find new versions of the actual custom repository packages, and replace them'))
+    parser.add_argument('--search', action='store', default=None,
+      dest='search', metavar=N_('term[s]'), help=N_('search the origin packages by name, description, section or provided name (ex: "web server", "section:python", "provides:mail-transport-agent")'))
+    parser.add_argument('--query', action='store', default=None,
+      dest='query', metavar=N_('package[s]'), help=N_('show the packages adding packages would bring in and the size to download, without adding them'))
+    parser.add_argument('--why', action='store', default=None,
+      dest='why', metavar=N_('package'), help=N_('show the dependency chain from the explicitly added packages (or the --query ones) to a package'))
+    parser.add_argument('--max-age', action='store', type=int, default=3600,
+      dest='max_age', metavar=N_('seconds'), help=N_('with --search, --query and --why, use the origin indexes checked less than seconds ago without contacting the mirrors (default 3600)'))
+    parser.add_argument('--resume', action='store_true', default=False,
+      dest='resume', help=N_('continue an interrupted add or upgrade without resolving or downloading again what was done'))
+    parser.add_argument('--dry-run', action='store_true', default=False,
+      dest='dry_run', help=N_('with --upgrade, only show what would be upgraded and the size to download'))
+    parser.add_argument('--serve', action='store', default=None,
+      dest='serve', metavar=N_('[host:]port'), help=N_('keep the indexes in memory and answer the requests of --server clients (ex: "8642")'))
+    parser.add_argument('--refresh', action='store', type=int, default=300,
+      dest='refresh', metavar=N_('seconds'), help=N_('with --serve, seconds between checks of the origin Release files, 0 to disable them (default 300)'))
+    parser.add_argument('--server', action='store', default=None,
+      dest='server', metavar=N_('url'), help=N_('send the requested actions to a running service (ex: "http://127.0.0.1:8642")'))
+    parser.add_argument('--stats', action='store_true', default=False,
+      dest='stats', help=N_('print transfer, parsing, resolution and index writing statistics at the end'))
+    parser.add_argument('--stats-file', action='store', default=None,
+      dest='stats_file', metavar=N_('file'), help=N_('write the statistics to a json file'))
+    parser.add_argument('--profile', action='store', default=None,
+      dest='profile', metavar=N_('file'), help=N_('run under cProfile, save the profile to a file and print the slowest calls'))
     parser.add_argument('-l', '--define-locale', action='store', default=False,
-      dest='define_locale', metavar=_('locale'), help=_('define output languaje based on locale'))
+      dest='define_locale', metavar=N_('locale'), help=N_('define output languaje based on locale'))
     
     args = parser.parse_args()
     if not args.custom_repository:
         parser.error(_('You need to specify the working path, run again with the --help option'))
     else:
-        if not args.add and not args.add_section and not args.remove and not args.upgrade:
+        if not args.add and not args.add_section and not args.remove and not args.upgrade and not args.gc \
+                and not args.resume and not args.serve and not args.search and not args.query and not args.why:
             parser.error(_('Arguments error, run again with the --help option'))
+        if args.limit_rate:
+            from scheduler import parse_rate
+            try:
+                parse_rate(args.limit_rate)
+            except ValueError:
+                parser.error(_('Invalid download rate: %s') % args.limit_rate)
 
-    start(args.custom_repository, args)
+    run(args.custom_repository, args)
 
 
 if __name__ == '__main__':
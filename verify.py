@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# verify.py
+#
+# Copyright 2014 Carlos Cesar Caballero Diaz <ccesar@linuxmail.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+__author__ = 'cccaballero'
+
+import os
+import json
+import threading
+from pool import file_sha256
+
+
+class HashCache(object):
+
+    def __init__(self, path=None):
+        """
+        SHA256 of local files keyed by device, inode, size and mtime, so a
+        file is only hashed again when it changes
+        :param path: json file the cache is persisted to, None to keep it in memory
+        """
+        self.path = path
+        self.hashes = {}
+        self.modified = False
+        self.lock = threading.Lock()
+        if path:
+            try:
+                with open(path) as f:
+                    self.hashes = json.load(f)
+            except (IOError, ValueError):
+                pass
+
+    def sha256(self, path):
+        stat = os.stat(path)
+        key = '%d:%d:%d:%d' % (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime)
+        with self.lock:
+            if key in self.hashes:
+                return self.hashes[key]
+        sha256 = file_sha256(path)
+        with self.lock:
+            self.hashes[key] = sha256
+            self.modified = True
+        return sha256
+
+    def save(self):
+        if not self.path or not self.modified:
+            return
+        directory = os.path.dirname(self.path)
+        try:
+            os.makedirs(directory)
+        except OSError:
+            pass
+        with self.lock:
+            with open(self.path + '.part', 'w') as f:
+                json.dump(self.hashes, f)
+            os.rename(self.path + '.part', self.path)
+            self.modified = False
+
+
+def is_present(path, size=None, sha256=None, hash_cache=None):
+    """
+    Tell if a file already has the contents described by a Packages stanza.
+    The size is checked with a single stat, the hash only when a hash cache
+    is given
+    :param path: local file path
+    :param size: expected size (string or int), None to skip the check
+    :param sha256: expected SHA256, checked only with a hash cache
+    :param hash_cache: HashCache used to verify the SHA256
+    :return: True if the file is present and correct
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return False
+    if size is not None and stat.st_size != int(size):
+        return False
+    if hash_cache is not None and sha256:
+        return hash_cache.sha256(path) == sha256
+    return size is not None or sha256 is None
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# version.py
+#
+# Copyright 2014 Carlos Cesar Caballero Diaz <ccesar@linuxmail.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+__author__ = 'cccaballero'
+
+import re
+try:
+    from functools import lru_cache
+except ImportError:
+    def lru_cache(maxsize=None):
+        def decorator(function):
+            cache = {}
+
+            def cached(argument):
+                if argument not in cache:
+                    if maxsize and len(cache) >= maxsize:
+                        cache.clear()
+                    cache[argument] = function(argument)
+                return cache[argument]
+            return cached
+        return decorator
+
+_SEGMENT_RE = re.compile(r'([^0-9]*)([0-9]*)')
+
+
+def _weight(char):
+    """
+    dpkg order of a non digit character: tilde sorts before everything,
+    even the end of the string, then letters, then the rest
+    """
+    if char == '~':
+        return -1
+    if char.isalpha():
+        return ord(char)
+    return ord(char) + 256
+
+
+def _part_key(part):
+    """
+    Return the sort key of an upstream version or a revision. The string is
+    split in alternating non digit and digit segments, non digit segments
+    become tuples of character weights closed by 0 (the end of string weight)
+    and digit segments become integers
+    """
+    key = []
+    position = 0
+    while True:
+        match = _SEGMENT_RE.match(part, position)
+        nondigits, digits = match.groups()
+        key.append(tuple(_weight(char) for char in nondigits) + (0,))
+        key.append(int(digits) if digits else 0)
+        position = match.end()
+        if position >= len(part):
+            break
+    # compares like an empty non digit segment against longer versions
+    key.append((0,))
+    return tuple(key)
+
+
+@lru_cache(maxsize=65536)
+def version_key(version):
+    """
+    Return a key that sorts Debian versions like dpkg does
+    :param version: version string ([epoch:]upstream[-revision])
+    :return: tuple, comparable with the keys of other versions
+    """
+    epoch = 0
+    if ':' in version:
+        epoch, version = version.split(':', 1)
+        try:
+            epoch = int(epoch)
+        except ValueError:
+            epoch = 0
+    if '-' in version:
+        upstream, revision = version.rsplit('-', 1)
+    else:
+        upstream, revision = version, ''
+    return epoch, _part_key(upstream), _part_key(revision)
+
+
+def compare_versions(version_a, version_b):
+    """
+    Compare two Debian versions
+    :return: negative, zero or positive like cmp
+    """
+    key_a = version_key(version_a)
+    key_b = version_key(version_b)
+    return (key_a > key_b) - (key_a < key_b)
+
+
+def is_newer(version_a, version_b):
+    """
+    Return True if version_a is newer than version_b
+    """
+    return version_key(version_a) > version_key(version_b)
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# writer.py
+#
+# Copyright 2014 Carlos Cesar Caballero Diaz <ccesar@linuxmail.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+__author__ = 'cccaballero'
+
+import os
+import hashlib
+import tempfile
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+BUFFER_SIZE = 1024 * 1024
+RELEASE_HASHES = (('MD5Sum', 'md5'), ('SHA1', 'sha1'), ('SHA256', 'sha256'))
+
+
+class _HashingFile(object):
+    """
+        Binary file wrapper computing size and hashes of everything written
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.size = 0
+        self.hashes = dict((name, hashlib.new(name)) for field, name in RELEASE_HASHES)
+
+    def write(self, data):
+        self.size += len(data)
+        for digest in self.hashes.values():
+            digest.update(data)
+        self.fileobj.write(data)
+
+    def flush(self):
+        self.fileobj.flush()
+
+    def close(self):
+        self.fileobj.close()
+
+    def checksums(self):
+        return dict((name, digest.hexdigest()) for name, digest in self.hashes.items())
+
+
+class _XzFile(object):
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.compressor = lzma.LZMACompressor(lzma.FORMAT_XZ)
+
+    def write(self, data):
+        self.fileobj.write(self.compressor.compress(data))
+
+    def close(self):
+        self.fileobj.write(self.compressor.flush())
+
+
+class IndexWriter(object):
+
+    def __init__(self, index_dir, index_filename='Packages', compress=('gz', 'xz')):
+        """
+        Writes a packages index and its compressed variants in a single
+        pass. Stanzas are buffered, the buffer is fed to every output at
+        once and sizes and hashes are computed while streaming. Outputs are
+        written to temporary files and renamed into place on close
+        :param index_dir: directory of the index
+        :param index_filename: name of the uncompressed index
+        :param compress: compressed variants to write, xz is skipped if
+            the lzma module is not available
+        """
+        self.index_dir = index_dir
+        self.buffer = []
+        self.buffered = 0
+        self.outputs = []
+        self.add_output(index_filename, None)
+        for extension in compress:
+            if extension == 'xz' and lzma is None:
+                continue
+            self.add_output('%s.%s' % (index_filename, extension), extension)
+
+    def add_output(self, filename, compression):
+        fd, tmp_path = tempfile.mkstemp(prefix='.%s.' % filename, dir=self.index_dir)
+        raw = _HashingFile(os.fdopen(fd, 'wb'))
+        if compression == 'gz':
+            import gzip
+
+            stream = gzip.GzipFile(filename=filename, mode='wb', fileobj=raw, mtime=0)
+        elif compression == 'xz':
+            stream = _XzFile(raw)
+        else:
+            stream = raw
+        self.outputs.append((filename, tmp_path, raw, stream))
+
+    def write(self, data):
+        self.buffer.append(data)
+        self.buffered += len(data)
+        if self.buffered >= BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        data = b''.join(self.buffer)
+        self.buffer = []
+        self.buffered = 0
+        for filename, tmp_path, raw, stream in self.outputs:
+            stream.write(data)
+
+    def close(self):
+        """
+        Finish every output and move it into place
+        :return: dictionary of filename and (size, checksums dictionary)
+        """
+        self.flush()
+        files = {}
+        for filename, tmp_path, raw, stream in self.outputs:
+            if stream is not raw:
+                stream.close()
+            raw.close()
+            os.chmod(tmp_path, 0o644)
+            os.rename(tmp_path, os.path.join(self.index_dir, filename))
+            files[filename] = (raw.size, raw.checksums())
+        self.outputs = []
+        return files
+
+    def abort(self):
+        """
+        Discard the temporary outputs
+        """
+        for filename, tmp_path, raw, stream in self.outputs:
+            raw.close()
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+        self.outputs = []
+
+
+def write_release(release_path, files, suite='tinp', components=('main',), architectures=()):
+    """
+    Write a Release file listing index files, atomically
+    :param release_path: path of the Release file
+    :param files: dictionary of path relative to the Release file and
+        (size, checksums dictionary)
+    """
+    from email.utils import formatdate
+
+    lines = ['Origin: tinP',
+             'Label: tinP',
+             'Suite: %s' % suite,
+             'Codename: %s' % suite,
+             'Date: %s' % formatdate(usegmt=True),
+             'Architectures: %s' % ' '.join(architectures),
+             'Components: %s' % ' '.join(components)]
+    for field, name in RELEASE_HASHES:
+        lines.append('%s:' % field)
+        for path in sorted(files):
+            size, checksums = files[path]
+            lines.append(' %s %16d %s' % (checksums[name], size, path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.Release.', dir=os.path.dirname(release_path))
+    with os.fdopen(fd, 'wb') as f:
+        f.write(('\n'.join(lines) + '\n').encode('utf-8'))
+    os.chmod(tmp_path, 0o644)
+    os.rename(tmp_path, release_path)
+
+
+def read_release(release_path):
+    """
+    Read the index files and architectures listed in a Release file written by write_release
+    :return: (files, architectures) tuple, files is a dictionary like the
+        one write_release takes, both are empty if there is no Release
+    """
+    fields = dict(RELEASE_HASHES)
+    files = {}
+    architectures = []
+    try:
+        with open(release_path, 'rb') as f:
+            lines = f.read().decode('utf-8').splitlines()
+    except (IOError, OSError):
+        return files, architectures
+    name = None
+    for line in lines:
+        if not line.startswith(' '):
+            field, _, value = line.partition(':')
+            name = fields.get(field)
+            if field == 'Architectures':
+                architectures = value.split()
+        elif name is not None:
+            checksum, size, path = line.split()
+            files.setdefault(path, (int(size), {}))[1][name] = checksum
+    return files, architectures